@@ -1,17 +1,130 @@
 import os
 import time
 
-import eikon as ek
 import pandas as pd
-import pandas_market_calendars as mcal
-from dotenv import load_dotenv
 
-if __name__ == "__main__":
-    load_dotenv()
-    ek.set_app_key(os.getenv("EIKON_APP_KEY"))
+from eikon_cache import ResponseCache
+
+# Exchange codes reported by Eikon that have a different name in the calendars
+EXCHANGE_FIXES = {"MTAA": "XMIL"}
+
+# Fallback exchanges for the RIC suffixes of STOXX 50 constituents
+EXCHANGE_BY_SUFFIX = {
+    "AS": "XAMS",
+    "BR": "XBRU",
+    "CO": "XCSE",
+    "DE": "XETR",
+    "HE": "XHEL",
+    "L": "XLON",
+    "MC": "XMAD",
+    "MI": "XMIL",
+    "PA": "XPAR",
+    "S": "XSWX",
+}
+
+
+def fetch_exchanges(rics: list[str]) -> dict[str, str]:
+    import eikon as ek
+
+    # Get the exchanges of all RICs in one request
+    while True:
+        try:
+            df = ek.get_data(
+                instruments=rics,
+                fields=["TR.ExchangeMarketIdCode"],
+                field_name=True,
+            )[0]
+            break
+
+        except Exception as e:
+            print(f"\tError getting exchanges for {len(rics)} RICs: {e}")
+            print("\tRetrying...")
+            # Sleep for 3 seconds before retrying
+            time.sleep(3)
+
+    return {
+        ric: exchange
+        for ric, exchange in zip(df["Instrument"], df["TR.EXCHANGEMARKETIDCODE"])
+        if isinstance(exchange, str) and exchange
+    }
+
+
+def get_exchanges(rics: list[str], cache: ResponseCache | None = None) -> dict:
+    """Exchanges of the RICs, the ones not in the response cache are requested."""
+    exchanges = (cache or ResponseCache()).lookup("exchange", rics, fetch_exchanges)
+    # Handle edge cases
+    return {ric: EXCHANGE_FIXES.get(e, e) for ric, e in exchanges.items()}
+
+
+def get_exchange(ric: str) -> str:
+    exchanges = get_exchanges([ric])
+    if ric not in exchanges:
+        raise ValueError(f"No exchange found for {ric}")
+
+    print(f"\tFound exchange: {exchanges[ric]}")
+    return exchanges[ric]
+
+
+def exchange_from_suffix(ric: str) -> str:
+    return EXCHANGE_BY_SUFFIX[ric.rsplit(".", 1)[-1]]
+
+
+def get_market_closes(exchange: str, start_date, end_date) -> pd.Series:
+    """Market close timestamps of an exchange indexed by plain trading dates."""
+    import pandas_market_calendars as mcal
 
-    directory = os.path.join(__file__, "..", "data", "prices")
+    # Get the trading calendar for the exchange
+    sched = mcal.get_calendar(exchange)
+    extended_sched = sched.schedule(start_date=start_date, end_date=end_date)
+    # Use market close times for timestamps
+    trading_days = extended_sched["market_close"]
 
+    # Build a map from plain dates to close‐of‐day timestamps
+    td = trading_days.copy()
+    td.index = td.index.normalize()
+    return td
+
+
+def add_timestamps_file(
+    file_path: str, exchange: str, start_date=None, end_date=None
+) -> int:
+    """
+    Replace the dates of a price file with the exchange closes.
+
+    The calendar covers the dates of the file unless a window is given, so files
+    that already have timestamps (e.g. exported by price_store.py) are unchanged.
+    """
+    df = pd.read_csv(file_path, index_col="Date")
+    if df.empty:
+        return 0
+
+    # Work on plain dates so that already timestamped files map to the same closes
+    dates = pd.DatetimeIndex(pd.to_datetime(df.index, utc=True).date)
+    td = get_market_closes(
+        exchange, start_date or dates.min(), end_date or dates.max()
+    )
+
+    # Replace the date‐only index with the corresponding timestamps
+    df.index = dates.map(td.to_dict())
+    df.index.name = "Date"
+
+    missing = df.index.isna().sum() - dates.isna().sum()
+    if missing:
+        print(f"\t{missing} dates of {file_path} are not trading days of {exchange}")
+
+    # Save the df
+    df.to_csv(file_path, index=True)
+
+    return len(df)
+
+
+def add_timestamps(
+    directory: str = os.path.join("data", "prices"),
+    get_exchange=get_exchange,
+    start_date=None,
+    end_date=None,
+) -> int:
+    rows = 0
     for file in os.listdir(directory):
         if not file.endswith(".csv"):
             continue
@@ -20,45 +133,29 @@ if __name__ == "__main__":
         ric = file.split(".")[0].replace("-", ".")
         print(f"Processing RIC: {ric}")
 
-        # Get the exchange for the RIC
-        success = False
-        while not success:
-            try:
-                exchange = ek.get_data(
-                    instruments=[ric],
-                    fields=["TR.ExchangeMarketIdCode"],
-                    field_name=True,
-                )[0]["TR.EXCHANGEMARKETIDCODE"][0]
-                print(f"\tFound exchange: {exchange}")
-                success = True
-
-            except Exception as e:
-                print(f"\tError getting exchange for {ric}: {e}")
-                print("\tRetrying...")
-                # Sleep for 3 seconds before retrying
-                time.sleep(3)
-
-        # Handle edge cases
-        if exchange == "MTAA":
-            exchange = "XMIL"
-
-        file_path = os.path.join(directory, file)
-        df = pd.read_csv(file_path, parse_dates=["Date"], index_col="Date")
-
-        # Get the trading calendar for the exchange
-        sched = mcal.get_calendar(exchange)
-        extended_sched = sched.schedule(start_date="2023-10-23", end_date="2025-06-11")
-        # Use market close times for timestamps
-        trading_days = extended_sched["market_close"]
-
-        # Build a map from plain dates to close‐of‐day timestamps
-        td = trading_days.copy()
-        td.index = td.index.normalize()
-
-        # Replace the date‐only index with the corresponding timestamps
-        df.index = df.index.map(td.to_dict())
-
-        # Save the df
-        df.to_csv(file_path, index=True)
+        rows += add_timestamps_file(
+            os.path.join(directory, file), get_exchange(ric), start_date, end_date
+        )
 
         print(f"Processed {file} with timestamps.")
+
+    return rows
+
+
+if __name__ == "__main__":
+    import eikon as ek
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    ek.set_app_key(os.getenv("EIKON_APP_KEY"))
+
+    # Exchanges of all RICs that aren't cached yet in a single request
+    directory = os.path.join("data", "prices")
+    exchanges = get_exchanges(
+        [
+            f.split(".")[0].replace("-", ".")
+            for f in os.listdir(directory)
+            if f.endswith(".csv")
+        ]
+    )
+    add_timestamps(directory, get_exchange=exchanges.__getitem__)
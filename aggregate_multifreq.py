@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Aggregate headline sentiment at several bar frequencies in a single pass.
+
+Every headline belongs to the next bar close at or after its creation time,
+exactly like the daily aggregation in aggregate_test.py. The headlines of a
+ticker are read and sorted once, for every frequency their bars are found with
+a single searchsorted into the bar closes and the features of aggregate_test.py
+are computed in one grouped pass. Daily bars are the market closes from
+data/prices (after add_timestamps.py), N-minute bars are resampled from minute
+prices in data/prices_intraday (download_headlines_prices.py --intraday).
+
+The output is a panel partitioned by frequency, e.g.
+data/aggregate_mf/freq=1D/ABBN-S.csv and data/aggregate_mf/freq=60min/ABBN-S.csv,
+with the same columns as data/aggregate/. Load one frequency with
+transfer_entropy.prepare_data(..., frequency="60min").
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from aggregate_test import (
+    FEATURE_DTYPES,
+    FEATURES,
+    HEADLINE_COLUMNS,
+    aggregate_features,
+    headline_columns,
+    test_stationarity,
+)
+from headline_store import find_headlines_file, read_headlines
+
+# Frequency of the bars ending at the daily market close
+DAILY = "1D"
+FREQUENCIES = [DAILY, "60min", "30min"]
+
+
+class SortedHeadlines:
+    """Headlines of one ticker, read and sorted by creation time once."""
+
+    def __init__(self, headlines_file: str):
+        headlines = read_headlines(headlines_file, HEADLINE_COLUMNS)
+        self.headlines = headlines.sort_values(
+            "versionCreated", kind="stable"
+        ).reset_index(drop=True)
+        self.times = self.headlines["versionCreated"].dt.tz_convert(None).to_numpy()
+
+    def bar_features(
+        self, bar_closes: pd.Series, features: list[str]
+    ) -> tuple[pd.DataFrame, int]:
+        """
+        Features of every bar, headlines at or before the first close count
+        towards the first bar.
+
+        Returns:
+            Features per bar and the number of bars up to the last one with headlines
+        """
+        closes = pd.to_datetime(bar_closes, utc=True).reset_index(drop=True)
+        # First close at or after every headline, len(closes) if there is none
+        bars = np.searchsorted(
+            closes.dt.tz_convert(None).to_numpy(), self.times, side="left"
+        )
+        assigned = bars < len(closes)
+        headlines, bars = self.headlines[assigned], bars[assigned]
+
+        columns = headline_columns(
+            headlines, closes.iloc[bars].set_axis(headlines.index)
+        )
+        values = (
+            aggregate_features(columns, bars, features)
+            .reindex(range(len(closes)), fill_value=0)
+            .astype({feature: FEATURE_DTYPES[feature] for feature in features})
+            .reset_index(drop=True)
+        )
+        return values, bars.max() + 1 if len(bars) else 0
+
+
+def daily_bars(prices_file: str) -> pd.DataFrame:
+    prices = pd.read_csv(prices_file, parse_dates=["Date"])
+    prices = prices[prices["CLOSE"].notna() & prices["Date"].notna()]
+    return prices.sort_values("Date")[["CLOSE", "Date"]].reset_index(drop=True)
+
+
+def load_intraday_prices(intraday_file: str) -> pd.Series:
+    prices = pd.read_csv(intraday_file, parse_dates=["Date"])
+    prices["Date"] = pd.to_datetime(prices["Date"], utc=True)
+    return prices.dropna(subset=["CLOSE"]).set_index("Date")["CLOSE"].sort_index()
+
+
+def intraday_bars(minute_closes: pd.Series, frequency: str) -> pd.DataFrame:
+    """Last close of every N-minute bar with trading, labelled by the bar end."""
+    closes = (
+        minute_closes.resample(frequency, label="right", closed="right")
+        .last()
+        .dropna()
+    )
+    return pd.DataFrame({"CLOSE": closes.to_numpy(), "Date": closes.index})
+
+
+def aggregate_ticker_multifreq(
+    ticker: str,
+    prices_file: str,
+    headlines_file: str,
+    intraday_file: str | None,
+    out_dir: str,
+    frequencies: list[str] = FREQUENCIES,
+    features: list[str] = list(FEATURES),
+) -> dict[str, int]:
+    """
+    Write the aggregate of one ticker for every frequency.
+
+    Returns:
+        Number of bars written per frequency
+    """
+    print(f"Processing {ticker}...")
+    headlines = SortedHeadlines(headlines_file)
+    # SENTIMENT is always needed for the stationarity test
+    features = ["SENTIMENT"] + [f for f in features if f != "SENTIMENT"]
+
+    minute_closes = None
+    if intraday_file is not None and os.path.exists(intraday_file):
+        minute_closes = load_intraday_prices(intraday_file)
+
+    rows = {}
+    for frequency in frequencies:
+        if frequency == DAILY:
+            df = daily_bars(prices_file)
+        elif minute_closes is not None:
+            df = intraday_bars(minute_closes, frequency)
+        else:
+            print(f"\tNo intraday prices for {ticker}, skipping {frequency}")
+            continue
+
+        values, n_bars = headlines.bar_features(df["Date"], features)
+        # Crop to the bars with sentiment available
+        df = pd.concat([df, values], axis=1).iloc[:n_bars].copy()
+        df["LOG_RETURNS"] = np.log(df["CLOSE"] / df["CLOSE"].shift(1))
+
+        out_file = os.path.join(out_dir, f"freq={frequency}", f"{ticker}.csv")
+        os.makedirs(os.path.dirname(out_file), exist_ok=True)
+
+        returns_stationary, returns_p = test_stationarity(
+            df["LOG_RETURNS"], "LOG_RETURNS"
+        )
+        sentiment_stationary, sentiment_p = test_stationarity(
+            df["SENTIMENT"], "SENTIMENT"
+        )
+        if not returns_stationary or not sentiment_stationary:
+            print(
+                f"\tRemoving {ticker} at {frequency} due to non-stationarity "
+                f"(LOG_RETURNS p-value: {returns_p}, SENTIMENT p-value: {sentiment_p})"
+            )
+            if os.path.exists(out_file):
+                os.remove(out_file)
+            continue
+
+        df.to_csv(out_file, index=False)
+        rows[frequency] = len(df)
+        print(f"\t{frequency}: {len(df)} bars")
+
+    return rows
+
+
+def aggregate_multifreq(
+    prices_path: str = os.path.join("data", "prices"),
+    intraday_path: str = os.path.join("data", "prices_intraday"),
+    headlines_path: str = os.path.join("data", "filtered_headlines"),
+    out_dir: str = os.path.join("data", "aggregate_mf"),
+    frequencies: list[str] = FREQUENCIES,
+    features: list[str] = list(FEATURES),
+) -> dict[str, int]:
+    totals = {frequency: 0 for frequency in frequencies}
+
+    for file in sorted(os.listdir(prices_path)):
+        if not file.endswith(".csv"):
+            continue
+
+        ticker = file.split(".")[0]
+        rows = aggregate_ticker_multifreq(
+            ticker,
+            os.path.join(prices_path, file),
+            find_headlines_file(headlines_path, ticker),
+            os.path.join(intraday_path, file),
+            out_dir,
+            frequencies,
+            features,
+        )
+        for frequency, n in rows.items():
+            totals[frequency] += n
+
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--frequencies",
+        nargs="+",
+        default=FREQUENCIES,
+        help=f"{DAILY} for daily closes, pandas offsets like 60min for intraday bars",
+    )
+    parser.add_argument("--prices-dir", default=os.path.join("data", "prices"))
+    parser.add_argument(
+        "--intraday-dir", default=os.path.join("data", "prices_intraday")
+    )
+    parser.add_argument(
+        "--headlines-dir", default=os.path.join("data", "filtered_headlines")
+    )
+    parser.add_argument("--out-dir", default=os.path.join("data", "aggregate_mf"))
+    parser.add_argument(
+        "--features", nargs="+", choices=list(FEATURES), default=list(FEATURES)
+    )
+    args = parser.parse_args()
+
+    totals = aggregate_multifreq(
+        args.prices_dir,
+        args.intraday_dir,
+        args.headlines_dir,
+        args.out_dir,
+        args.frequencies,
+        args.features,
+    )
+    for frequency, rows in totals.items():
+        print(f"{frequency}: {rows} bars in total")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,85 @@
+import argparse
 import os
 
 import numpy as np
 import pandas as pd
-from statsmodels.tsa.stattools import adfuller
 
+from headline_store import find_headlines_file, read_headlines
+
+SENTIMENT_SCORES = {"positive": 1, "neutral": 0, "negative": -1}
+
+# Headlines lose half of their weight in SENTIMENT_DECAYED for every half-life
+# between publication and their close, e.g. news from weekends and holidays
+DECAY_HALF_LIFE = pd.Timedelta(hours=24)
+
+# Features per close timestamp as named aggregations of per-headline columns,
+# all computed in one groupby
+FEATURES = {
+    "SENTIMENT": ("sentiment_score", "sum"),
+    "SENTIMENT_WEIGHTED": ("weighted_score", "sum"),
+    "SENTIMENT_MEAN": ("sentiment_score", "mean"),
+    "SENTIMENT_DECAYED": ("decayed_score", "sum"),
+    "POSITIVE": ("is_positive", "sum"),
+    "NEGATIVE": ("is_negative", "sum"),
+    "NEUTRAL": ("is_neutral", "sum"),
+    "VOLUME": ("sentiment_score", "size"),
+    "REUTERS_VOLUME": ("is_reuters", "sum"),
+}
+
+# Headline columns the features are computed from, the texts are never loaded
+HEADLINE_COLUMNS = ["versionCreated", "label", "score", "sourceCode"]
+
+FEATURE_DTYPES = {
+    "SENTIMENT": "int64",
+    "SENTIMENT_WEIGHTED": "float64",
+    "SENTIMENT_MEAN": "float64",
+    "SENTIMENT_DECAYED": "float64",
+    "POSITIVE": "int64",
+    "NEGATIVE": "int64",
+    "NEUTRAL": "int64",
+    "VOLUME": "int64",
+    "REUTERS_VOLUME": "int64",
+}
+
+
+def headline_columns(headlines_df: pd.DataFrame, closes: pd.Series) -> pd.DataFrame:
+    """
+    Per-headline values aggregated by the features.
+
+    Args:
+        headlines_df: Headlines with label, score, versionCreated (and sourceCode)
+        closes: Close timestamp each headline is assigned to
+    """
+    sentiment = headlines_df["label"].map(SENTIMENT_SCORES).to_numpy()
+    age = ((closes - headlines_df["versionCreated"]) / DECAY_HALF_LIFE).to_numpy()
+    source = headlines_df.get("sourceCode", pd.Series("", index=headlines_df.index))
+
+    return pd.DataFrame(
+        {
+            "sentiment_score": sentiment,
+            "weighted_score": sentiment * headlines_df["score"].to_numpy(),
+            "decayed_score": sentiment * np.exp2(-age),
+            "is_positive": sentiment == 1,
+            "is_negative": sentiment == -1,
+            "is_neutral": sentiment == 0,
+            "is_reuters": (source == "NS:RTRS").to_numpy(),
+        },
+        index=headlines_df.index,
+    )
+
+
+def aggregate_features(columns: pd.DataFrame, groups, features: list[str]):
+    return columns.groupby(groups).agg(**{name: FEATURES[name] for name in features})
+
+
+def create_sentiment_df(prices_path, headlines_path, features=list(FEATURES)):
+    # SENTIMENT is always needed for the stationarity test
+    features = ["SENTIMENT"] + [f for f in features if f != "SENTIMENT"]
 
-def create_sentiment_df(prices_path, headlines_path):
     # Load price data with timestamps
     price_df = pd.read_csv(prices_path, parse_dates=["Date"])
     # Load headlines and parse creation times
-    headlines_df = pd.read_json(headlines_path)
-    headlines_df["versionCreated"] = pd.to_datetime(headlines_df["versionCreated"])
-
-    # Map sentiment labels to scores
-    headlines_df["sentiment_score"] = headlines_df["label"].map(
-        {"positive": 1, "neutral": 0, "negative": -1}
-    )
+    headlines_df = read_headlines(headlines_path, HEADLINE_COLUMNS)
 
     # Ensure sorted order for merge_asof
     price_df = price_df.sort_values("Date")
@@ -37,24 +101,22 @@ def create_sentiment_df(prices_path, headlines_path):
     # Drop headlines without an assigned close timestamp
     merged = merged.dropna(subset=["Date"])
 
-    # Sum sentiment scores per timestamp
-    sentiment_sum = (
-        merged.groupby("Date")["sentiment_score"]
-        .sum()
-        .reset_index()
-        .rename(columns={"sentiment_score": "SENTIMENT"})
-    )
+    # All features per timestamp in one grouped pass
+    columns = headline_columns(merged, merged["Date"])
+    sentiment_features = aggregate_features(
+        columns, merged["Date"], features
+    ).reset_index()
 
-    # Merge summed sentiment with price data
+    # Merge the features with price data, days without headlines are zeros
     result_df = (
         price_df[["CLOSE", "Date"]]
-        .merge(sentiment_sum, on="Date", how="left")
-        .fillna({"SENTIMENT": 0})
+        .merge(sentiment_features, on="Date", how="left")
+        .fillna({feature: 0 for feature in features})
+        .astype({feature: FEATURE_DTYPES[feature] for feature in features})
     )
-    result_df["SENTIMENT"] = result_df["SENTIMENT"].astype(int)
 
     # Crop result to available sentiment dates
-    last_date = sentiment_sum["Date"].max()
+    last_date = sentiment_features["Date"].max()
     result_df = result_df[result_df["Date"] <= last_date]
     return result_df
 
@@ -63,6 +125,9 @@ def test_stationarity(serie, column_name):
     """
     Test the stationarity of a time series using ADF test.
     """
+    # Imported here, statsmodels takes long to import
+    from statsmodels.tsa.stattools import adfuller
+
     stationary = True
 
     adf_result = adfuller(serie.dropna())
@@ -73,42 +138,69 @@ def test_stationarity(serie, column_name):
     return stationary, p_value_adf
 
 
-if __name__ == "__main__":
-    prices_path = os.path.join("data", "prices")
-    headlines_path = os.path.join("data", "filtered_headlines")
+def aggregate_ticker(
+    prices_file: str,
+    headlines_file: str,
+    out_file: str,
+    features: list[str] = list(FEATURES),
+) -> int:
+    ticker = os.path.basename(prices_file).split(".")[0]
+    print(f"Processing {ticker}...")
+
+    df = create_sentiment_df(prices_file, headlines_file, features)
+
+    # compute log returns on the CLOSE
+    df["LOG_RETURNS"] = np.log(df["CLOSE"] / df["CLOSE"].shift(1))
 
-    aggregate_path = os.path.join("data", "aggregate")
+    returns_stationary, returns_p = test_stationarity(df["LOG_RETURNS"], "LOG_RETURNS")
+    sentiment_stationary, sentiment_p = test_stationarity(df["SENTIMENT"], "SENTIMENT")
+
+    if not returns_stationary or not sentiment_stationary:
+        print(
+            f"\n!!!\nRemoving {ticker} from the dataset due to non-stationarity -- LOG_RETURNS {'non-' if not returns_stationary else ''}stationary (p-value: {returns_p}), SENTIMENT {'non-' if not sentiment_stationary else ''}stationary (p-value: {sentiment_p}).\n!!!\n"
+        )
+        # Don't leave an aggregate from a previous run behind
+        if os.path.exists(out_file):
+            os.remove(out_file)
+        return len(df)
+
+    df.to_csv(out_file, index=False)
+    return len(df)
+
+
+def aggregate(
+    prices_path: str = os.path.join("data", "prices"),
+    headlines_path: str = os.path.join("data", "filtered_headlines"),
+    aggregate_path: str = os.path.join("data", "aggregate"),
+    features: list[str] = list(FEATURES),
+) -> int:
     os.makedirs(aggregate_path, exist_ok=True)
 
+    rows = 0
     for file in os.listdir(prices_path):
         if not file.endswith(".csv"):
             continue
 
         ticker = file.split(".")[0]
-        print(f"Processing {ticker}...")
-
-        df = create_sentiment_df(
+        rows += aggregate_ticker(
             os.path.join(prices_path, file),
-            os.path.join(headlines_path, f"{ticker}_headlines.json"),
+            find_headlines_file(headlines_path, ticker),
+            os.path.join(aggregate_path, f"{ticker}.csv"),
+            features,
         )
 
-        # compute log returns on the CLOSE
-        df["LOG_RETURNS"] = np.log(df["CLOSE"] / df["CLOSE"].shift(1))
+    return rows
 
-        returns_stationary, returns_p = test_stationarity(
-            df["LOG_RETURNS"], "LOG_RETURNS"
-        )
-        sentiment_stationary, sentiment_p = test_stationarity(
-            df["SENTIMENT"], "SENTIMENT"
-        )
 
-        if not returns_stationary or not sentiment_stationary:
-            print(
-                f"\n!!!\nRemoving {ticker} from the dataset due to non-stationarity -- LOG_RETURNS {'non-' if not returns_stationary else ''}stationary (p-value: {returns_p}), SENTIMENT {'non-' if not sentiment_stationary else ''}stationary (p-value: {sentiment_p}).\n!!!\n"
-            )
-            continue
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregate sentiment features")
+    parser.add_argument(
+        "--features",
+        nargs="+",
+        choices=list(FEATURES),
+        default=list(FEATURES),
+        help="Features to compute per close timestamp (SENTIMENT is always included)",
+    )
+    args = parser.parse_args()
 
-        df.to_csv(
-            os.path.join(aggregate_path, f"{ticker}.csv"),
-            index=False,
-        )
+    aggregate(features=args.features)
@@ -1,42 +1,300 @@
+import argparse
+import hashlib
 import json
+import math
+import multiprocessing
 import os
+import resource
+import statistics
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 
-from transformers import pipeline
+import pandas as pd
 
-if __name__ == "__main__":
-    models = [
-        "mrm8488/distilroberta-finetuned-financial-news-sentiment-analysis",
-        "ProsusAI/finbert",
-        "yiyanghkust/finbert-tone",
-    ]
+MODELS = [
+    "mrm8488/distilroberta-finetuned-financial-news-sentiment-analysis",
+    "ProsusAI/finbert",
+    "yiyanghkust/finbert-tone",
+]
+
+FOLDER = os.path.join("data", "benchmark")
+CACHE_FOLDER = os.path.join(FOLDER, "cache")
+QWEN_RESULTS_PATH = os.path.join(FOLDER, "qwen.jsonl")
+
+LABELS = ["positive", "neutral", "negative"]
 
-    folder = os.path.join("data", "benchmark")
-    os.makedirs(folder, exist_ok=True)
+# Memory assumed for a model that hasn't been measured yet
+DEFAULT_MODEL_MEMORY_MB = 2048
+# Number of single-headline calls used to measure latency
+LATENCY_SAMPLES = 20
 
+
+def load_dataset():
     with open(os.path.join("data", "random_headlines.json"), mode="r") as f:
         data = json.load(f)
 
     headlines = [item["headline"] for item in data]
-    total_headlines = len(headlines)
     labels = [item["sentiment"] for item in data]
 
-    for model_path in models:
-        nlp = pipeline("sentiment-analysis", model=model_path, tokenizer=model_path)
-        results = nlp(headlines)
+    digest = hashlib.blake2b(
+        json.dumps([headlines, labels]).encode("utf-8"), digest_size=8
+    ).hexdigest()
+    return headlines, labels, digest
+
+
+def cache_path(model_path, dataset_hash):
+    return os.path.join(
+        CACHE_FOLDER, f"{model_path.replace('/', '_')}_{dataset_hash}.json"
+    )
+
+
+def time_model(nlp, headlines):
+    # Warm up before timing
+    nlp(headlines[:1])
+
+    latencies = []
+    for headline in headlines[:LATENCY_SAMPLES]:
+        start = time.perf_counter()
+        nlp([headline])
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    results = nlp(headlines)
+    inference_s = time.perf_counter() - start
+
+    return {
+        "predictions": [result["label"].lower() for result in results],
+        "scores": [result["score"] for result in results],
+        "latency_ms": statistics.median(latencies) * 1000,
+        "throughput": len(headlines) / inference_s,
+    }
+
+
+def run_model(model_path, headlines):
+    """Load one model and predict all headlines, meant to run in its own process."""
+    from transformers import pipeline
+
+    start = time.perf_counter()
+    nlp = pipeline("sentiment-analysis", model=model_path, tokenizer=model_path)
+    load_s = time.perf_counter() - start
+
+    return {
+        "model": model_path,
+        **time_model(nlp, headlines),
+        "load_s": load_s,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def run_model_remote(model_path, headlines, server):
+    """
+    Predict all headlines on a running sentiment_server.py. load_s is the time
+    of the first request, close to zero once the server has the model loaded.
+    """
+    from predict import SentimentClient
+
+    nlp = SentimentClient(server, model_path)
+    start = time.perf_counter()
+    nlp(headlines[:1])
+    load_s = time.perf_counter() - start
+
+    return {
+        "model": model_path,
+        **time_model(nlp, headlines),
+        "load_s": load_s,
+        # The model's memory is in the server process
+        "peak_rss_mb": float("nan"),
+    }
+
+
+def estimated_memory_mb(model_path):
+    # Use the footprint measured by any previous run of the model
+    prefix = model_path.replace("/", "_")
+    for file in os.listdir(CACHE_FOLDER):
+        # <model>_<dataset hash>.json, names of other models may start the same
+        if file.endswith(".json") and file.rsplit("_", 1)[0] == prefix:
+            with open(os.path.join(CACHE_FOLDER, file)) as f:
+                peak_rss_mb = json.load(f)["peak_rss_mb"]
+            # Not measured when the model ran on the sentiment server
+            if not math.isnan(peak_rss_mb):
+                return peak_rss_mb
+
+    return DEFAULT_MODEL_MEMORY_MB
+
+
+def run_models(models, headlines, dataset_hash, memory_budget_mb):
+    """
+    Run the models in worker processes, keeping the sum of their estimated
+    memory footprints within the budget. Each worker handles a single model so
+    its memory is freed as soon as the model is done.
+    """
+    pending = [(model, estimated_memory_mb(model)) for model in models]
+    running = {}
+
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=len(models), mp_context=ctx, max_tasks_per_child=1
+    ) as executor:
+        while pending or running:
+            # Admit models while they fit, always at least one
+            used = sum(memory for _, memory in running.values())
+            for model, memory in list(pending):
+                if running and used + memory > memory_budget_mb:
+                    continue
+
+                print(f"Running {model} (~{memory:.0f} MB)...")
+                future = executor.submit(run_model, model, headlines)
+                running[future] = (model, memory)
+                pending.remove((model, memory))
+                used += memory
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                model, _ = running.pop(future)
+                result = future.result()
+                result["dataset"] = dataset_hash
 
-        correct = 0
-        with open(
-            os.path.join(folder, f"{model_path.replace('/', '_')}.log"), mode="w"
-        ) as f:
-            print(f"Model: {model_path}\n", file=f)
+                with open(cache_path(model, dataset_hash), "w") as f:
+                    json.dump(result, f)
 
-            for headline, label, result in zip(headlines, labels, results):
-                if label.lower() == result["label"].lower():
-                    correct += 1
+                print(f"Finished {model}")
 
-                else:
-                    print(f"{headline}", file=f)
-                    print(f"\tExpected: {label}\tPredicted: {result['label']}", file=f)
-                    print(f"\t\t{result['score']}", file=f)
 
-            print("\nAccuracy:", correct / total_headlines, file=f)
+def load_qwen_result(total_headlines):
+    from benchmark_qwen import MODEL, iter_results
+
+    predictions = [""] * total_headlines
+    for i, result in iter_results(QWEN_RESULTS_PATH):
+        if i < total_headlines:
+            predictions[i] = result.get("sentiment", "").lower()
+
+    return {
+        "model": f"{MODEL} (Ollama)",
+        "predictions": predictions,
+        "load_s": float("nan"),
+        "latency_ms": float("nan"),
+        "throughput": float("nan"),
+        "peak_rss_mb": float("nan"),
+    }
+
+
+def write_log(model_path, headlines, labels, result):
+    correct = 0
+    with open(
+        os.path.join(FOLDER, f"{model_path.replace('/', '_')}.log"), mode="w"
+    ) as f:
+        print(f"Model: {model_path}\n", file=f)
+
+        for headline, label, predicted, score in zip(
+            headlines, labels, result["predictions"], result["scores"]
+        ):
+            if label.lower() == predicted:
+                correct += 1
+
+            else:
+                print(f"{headline}", file=f)
+                print(f"\tExpected: {label}\tPredicted: {predicted}", file=f)
+                print(f"\t\t{score}", file=f)
+
+        print("\nAccuracy:", correct / len(headlines), file=f)
+
+    return correct / len(headlines)
+
+
+def compare(results, headlines, labels):
+    truth = pd.Series([label.lower() for label in labels], name="expected")
+
+    rows = []
+    for result in results:
+        if "scores" in result:
+            accuracy = write_log(result["model"], headlines, labels, result)
+        else:
+            # Qwen writes its own log in benchmark_qwen.py
+            accuracy = (truth == pd.Series(result["predictions"])).mean()
+
+        predicted = pd.Series(result["predictions"], name="predicted")
+        confusion = pd.crosstab(truth, predicted).reindex(
+            index=LABELS, columns=LABELS, fill_value=0
+        )
+
+        print(f"\n{result['model']}, accuracy: {accuracy:.3f}")
+        print(confusion.to_string())
+
+        row = {
+            "model": result["model"],
+            "accuracy": accuracy,
+            "latency_ms": result["latency_ms"],
+            "throughput": result["throughput"],
+            "load_s": result["load_s"],
+            "peak_rss_mb": result["peak_rss_mb"],
+        }
+        # Flatten the confusion matrix into expected->predicted columns
+        for expected in LABELS:
+            for predicted_label in LABELS:
+                row[f"{expected}->{predicted_label}"] = confusion.loc[
+                    expected, predicted_label
+                ]
+        rows.append(row)
+
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sentiment models")
+    parser.add_argument("--models", nargs="+", default=MODELS)
+    parser.add_argument(
+        "--memory-budget-gb",
+        type=float,
+        default=8.0,
+        help="Memory the models running in parallel may use together",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Ignore cached predictions"
+    )
+    parser.add_argument(
+        "--server",
+        help="Predict on a running sentiment_server.py instead of loading the "
+        "models in worker processes",
+    )
+    args = parser.parse_args()
+
+    os.makedirs(CACHE_FOLDER, exist_ok=True)
+
+    headlines, labels, dataset_hash = load_dataset()
+
+    # Only models without cached predictions for this dataset need inference
+    stale = [
+        model
+        for model in args.models
+        if args.force or not os.path.exists(cache_path(model, dataset_hash))
+    ]
+    print(f"Cached: {len(args.models) - len(stale)}, to run: {len(stale)}")
+    if stale and args.server:
+        # The server holds the models, requests for them run one after another
+        for model in stale:
+            print(f"Running {model} on {args.server}...")
+            result = run_model_remote(model, headlines, args.server)
+            result["dataset"] = dataset_hash
+            with open(cache_path(model, dataset_hash), "w") as f:
+                json.dump(result, f)
+    elif stale:
+        run_models(stale, headlines, dataset_hash, args.memory_budget_gb * 1024)
+
+    results = []
+    for model in args.models:
+        with open(cache_path(model, dataset_hash)) as f:
+            results.append(json.load(f))
+
+    if os.path.exists(QWEN_RESULTS_PATH):
+        results.append(load_qwen_result(len(headlines)))
+
+    comparison = compare(results, headlines, labels)
+    comparison.to_csv(os.path.join(FOLDER, "comparison.csv"), index=False)
+
+    print()
+    print(comparison.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Benchmark the preprocessing pipeline stages on synthetic fixtures.
+
+For every fixture size the stages predict -> filter -> timestamps -> aggregate
+are run through their callable entry points on fixtures generated by
+generate_pipeline_fixtures.py. Each stage runs in a fresh worker process so that
+wall time, peak RSS and rows/sec are attributed to that stage alone. Results can
+be stored as a baseline and later runs are compared against it.
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from generate_pipeline_fixtures import generate_fixtures
+
+STAGES = ["predict", "filter", "timestamps", "aggregate"]
+
+
+def run_predict(root: str, model_path: str) -> int:
+    from predict import load_nlp, predict_folder
+
+    # Uses the sentiment server given by $SENTIMENT_SERVER if there is one
+    return predict_folder(
+        os.path.join(root, "data", "headlines"),
+        os.path.join(root, "data", "headlines_preds"),
+        nlp=load_nlp(model_path),
+    )
+
+
+def run_filter(root: str, model_path: str) -> int:
+    import filter_headlines
+
+    stats = filter_headlines.main(
+        Path(root, "data", "headlines_preds"), Path(root, "data", "filtered_headlines")
+    )
+    return stats.get("total_headlines", 0)
+
+
+def run_timestamps(root: str, model_path: str) -> int:
+    from add_timestamps import add_timestamps, exchange_from_suffix
+
+    return add_timestamps(
+        os.path.join(root, "data", "prices"), get_exchange=exchange_from_suffix
+    )
+
+
+def run_aggregate(root: str, model_path: str) -> int:
+    from aggregate_test import aggregate
+
+    return aggregate(
+        os.path.join(root, "data", "prices"),
+        os.path.join(root, "data", "filtered_headlines"),
+        os.path.join(root, "data", "aggregate"),
+    )
+
+
+STAGE_FUNCTIONS = {
+    "predict": run_predict,
+    "filter": run_filter,
+    "timestamps": run_timestamps,
+    "aggregate": run_aggregate,
+}
+
+
+def measure_stage(stage: str, root: str, model_path: str, verbose: bool) -> dict:
+    """Run one stage and measure it, meant to be called in a fresh process."""
+    output = sys.stdout if verbose else open(os.devnull, "w")
+
+    with contextlib.redirect_stdout(output):
+        start = time.perf_counter()
+        rows = STAGE_FUNCTIONS[stage](root, model_path)
+        wall = time.perf_counter() - start
+
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    return {
+        "wall_s": wall,
+        "peak_rss_mb": peak_rss_mb,
+        "rows": rows,
+        "rows_per_s": rows / wall if wall > 0 else float("nan"),
+    }
+
+
+def benchmark(
+    sizes: list[int],
+    stages: list[str],
+    n_tickers: int,
+    model_path: str,
+    verbose: bool,
+) -> pd.DataFrame:
+    ctx = multiprocessing.get_context("spawn")
+    rows = []
+
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as root:
+            print(f"Generating fixtures with {size:,} headlines...")
+            generate_fixtures(root, size, n_tickers)
+
+            for stage in stages:
+                with ctx.Pool(1) as pool:
+                    result = pool.apply(
+                        measure_stage, (stage, root, model_path, verbose)
+                    )
+
+                print(
+                    f"\t{stage}: {result['wall_s']:.2f} s, "
+                    f"{result['peak_rss_mb']:.0f} MB peak RSS, "
+                    f"{result['rows_per_s']:,.0f} rows/s"
+                )
+                rows.append({"size": size, "stage": stage, **result})
+
+    return pd.DataFrame(rows)
+
+
+def find_regressions(
+    report: pd.DataFrame, baseline: pd.DataFrame, tolerance: float
+) -> list[str]:
+    merged = report.merge(baseline, on=["size", "stage"], suffixes=("", "_baseline"))
+
+    regressions = []
+    for _, row in merged.iterrows():
+        for metric in ["wall_s", "peak_rss_mb"]:
+            if row[metric] > row[f"{metric}_baseline"] * (1 + tolerance):
+                regressions.append(
+                    f"{row['stage']} @ {row['size']:,} headlines: {metric} "
+                    f"{row[metric]:.2f} vs. baseline {row[f'{metric}_baseline']:.2f}"
+                )
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1_000, 10_000, 100_000],
+        help="Numbers of headlines (up to 10M)",
+    )
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--tickers", type=int, default=10)
+    parser.add_argument("--model", default="ProsusAI/finbert")
+    parser.add_argument(
+        "--out", default=os.path.join("data", "benchmark", "pipeline.csv")
+    )
+    parser.add_argument(
+        "--baseline",
+        default=os.path.join("data", "benchmark", "pipeline_baseline.json"),
+    )
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="Store this run as the baseline"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Relative slowdown or memory growth reported as a regression",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Show stage output")
+    args = parser.parse_args()
+
+    report = benchmark(args.sizes, args.stages, args.tickers, args.model, args.verbose)
+
+    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    report.to_csv(args.out, index=False)
+    print(report.to_string(index=False))
+    print(f"\nBenchmark saved to {args.out}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report.to_dict(orient="records"), f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare against, store one with --save-baseline")
+        return
+
+    with open(args.baseline) as f:
+        baseline = pd.DataFrame(json.load(f))
+
+    regressions = find_regressions(report, baseline, args.tolerance)
+    if regressions:
+        print(f"\nRegressions against the baseline (tolerance {args.tolerance:.0%}):")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+
+    print("\nNo regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 import json
 import os
@@ -66,24 +67,15 @@ Please now process the list and provide your analysis.
 INPUT:
 """
 
-# Create a custom client with a specific host
-client = ollama.AsyncClient(host="http://100.119.56.67:11434")
+HOST = os.getenv("OLLAMA_HOST", "http://100.119.56.67:11434")
+MODEL = "qwen3:8b"
+RESULTS_PATH = os.path.join("data", "benchmark", "qwen.jsonl")
+TEMPLATE = "{{ if .System }}<|im_start|>system\n{{ .System }}<|im_end|>\n{{ end }}{{ if .Prompt }}<|im_start|>user\n{{ .Prompt }}<|im_end|>\n{{ end }}<|im_start|>assistant\n"
 
 
-# Function to analyze a single headline
-async def analyze_headline(headline):
-    response = await client.generate(
-        model="qwen3:8b",
-        prompt=headline,
-        options={
-            "system": SYSTEM_PROMPT,
-            "template": "{{ if .System }}<|im_start|>system\n{{ .System }}<|im_end|>\n{{ end }}{{ if .Prompt }}<|im_start|>user\n{{ .Prompt }}<|im_end|>\n{{ end }}<|im_start|>assistant\n",
-        },
-        stream=False,
-    )
-
+def parse_response(text):
     # Parse response: <think> something </think> json
-    match = re.search(r"<think>([\s\S]*?)<\/think>\s*([\s\S]+)", response["response"])
+    match = re.search(r"<think>([\s\S]*?)<\/think>\s*([\s\S]+)", text)
     if match:
         think = match.group(1).strip()
         try:
@@ -91,35 +83,186 @@ async def analyze_headline(headline):
         except Exception as e:
             obj = {"error": f"Failed to parse JSON, {str(e)}", "raw": match.group(2)}
 
-        # If obj is an array with one object, merge think into that object
-        if isinstance(obj, list) and len(obj) == 1 and isinstance(obj[0], dict):
-            obj = {**obj[0], "think": think}
-        elif isinstance(obj, dict):
-            obj["think"] = think
+        return think, obj
+
+    return None, {"error": "No <think> tag found", "raw": text}
+
+
+def reassemble(headlines, obj, think):
+    """
+    Match the model's answers back to the input headlines.
+
+    The model is asked to preserve the order but doesn't always do so, answers
+    are therefore matched by the echoed headline first and by position second.
+    """
+    if isinstance(obj, dict):
+        obj = [obj]
+
+    if not isinstance(obj, list) or len(obj) != len(headlines):
+        raise ValueError(
+            f"Expected {len(headlines)} results, got "
+            f"{len(obj) if isinstance(obj, list) else type(obj).__name__}"
+        )
+
+    def normalise(text):
+        return re.sub(r"\W+", " ", str(text)).strip().lower()
+
+    by_headline = {
+        normalise(item.get("headline", "")): item
+        for item in obj
+        if isinstance(item, dict)
+    }
+
+    results = []
+    for i, headline in enumerate(headlines):
+        item = by_headline.get(normalise(headline), obj[i])
+        if not isinstance(item, dict) or "sentiment" not in item:
+            raise ValueError(f"Malformed result for headline {i}: {item}")
+        results.append({**item, "think": think})
+
+    return results
+
+
+# Function to analyze a batch of headlines, one per line of the prompt
+async def analyze_headlines(client, headlines):
+    response = await client.generate(
+        model=MODEL,
+        prompt="\n".join(headlines),
+        system=SYSTEM_PROMPT,
+        template=TEMPLATE,
+        stream=False,
+    )
+
+    think, obj = parse_response(response["response"])
+    if think is None or "error" in obj:
+        raise ValueError(obj["error"])
+
+    return reassemble(headlines, obj, think)
+
+
+# Function to analyze a single headline
+async def analyze_headline(client, headline):
+    return (await analyze_headlines(client, [headline]))[0]
+
+
+async def analyze_batch(client, semaphore, headlines, timeout, retries):
+    """Analyze one batch under the concurrency limit, with timeout and retries."""
+    error = None
+    for attempt in range(retries + 1):
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(
+                    analyze_headlines(client, headlines), timeout=timeout
+                )
+
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                print(f"Error analysing batch ({attempt + 1}/{retries + 1}): {error}")
+
+        # Back off outside of the semaphore so others can use the slot
+        await asyncio.sleep(2**attempt)
+
+    # A batch that keeps failing may still succeed headline by headline
+    if len(headlines) > 1:
+        return [
+            (await analyze_batch(client, semaphore, [headline], timeout, retries))[0]
+            for headline in headlines
+        ]
+
+    return [{"error": error, "headline": headlines[0]}]
+
+
+def iter_results(path=RESULTS_PATH):
+    """Stream (index, result) pairs from the JSONL results file."""
+    if not os.path.exists(path):
+        return
+
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Last line cut short by a crash
+                continue
+
+            yield record.pop("index"), record
+
+
+def drop_partial_line(path=RESULTS_PATH):
+    """Cut a line left unfinished by a crash, so appended records start anew."""
+    if not os.path.exists(path):
+        return
+
+    with open(path, "rb+") as file:
+        end = 0
+        for line in file:
+            if not line.endswith(b"\n"):
+                break
+            end += len(line)
+        file.truncate(end)
 
-        return obj
 
-    return {"error": "No <think> tag found", "raw": response["response"]}
+async def analyze_indexed_batch(client, semaphore, indices, headlines, timeout, retries):
+    return indices, await analyze_batch(client, semaphore, headlines, timeout, retries)
 
 
 # Process all headlines
-async def ollama_predict():
+async def ollama_predict(
+    host=HOST,
+    concurrency=4,
+    batch_size=1,
+    timeout=300.0,
+    retries=2,
+    resume=False,
+    results_path=RESULTS_PATH,
+):
     # Load headlines from JSON file
     with open(os.path.join("data", "random_headlines.json"), "r") as file:
         headlines_data = json.load(file)
 
-    results = []
-    for item in headlines_data:
-        result = await analyze_headline(item["headline"])
-        results.append(result)
-        print(result)
+    headlines = [item["headline"] for item in headlines_data]
+
+    # Skip headlines that were labelled successfully by a previous run
+    done = set()
+    if resume:
+        done = {i for i, result in iter_results(results_path) if "error" not in result}
+        print(f"Resuming, {len(done)}/{len(headlines)} headlines already labelled")
+
+    todo = [i for i in range(len(headlines)) if i not in done]
+    if not todo:
+        return
+
+    # Create a custom client with a specific host
+    client = ollama.AsyncClient(host=host)
+    # Keep at most `concurrency` requests in flight, ideally the server's slots
+    semaphore = asyncio.Semaphore(concurrency)
+
+    batches = [todo[i : i + batch_size] for i in range(0, len(todo), batch_size)]
+    tasks = [
+        analyze_indexed_batch(
+            client, semaphore, batch, [headlines[i] for i in batch], timeout, retries
+        )
+        for batch in batches
+    ]
+
+    # Append every batch as soon as it arrives so a crash only loses what's in flight
+    os.makedirs(os.path.dirname(results_path), exist_ok=True)
+    if resume:
+        drop_partial_line(results_path)
+    with open(results_path, "a" if resume else "w", encoding="utf-8") as file:
+        for task in asyncio.as_completed(tasks):
+            indices, results = await task
 
-    with open(os.path.join("data", "benchmark", "qwen.json"), "w") as file:
-        json.dump(results, file, indent=2)
+            for i, result in zip(indices, results):
+                file.write(json.dumps({"index": i, **result}, ensure_ascii=False))
+                file.write("\n")
+                print(result)
 
+            file.flush()
 
-def evaluate_print():
-    model_path = "qwen3:8b"
+
+def evaluate_print(results_path=RESULTS_PATH):
+    model_path = MODEL
 
     with open(os.path.join("data", "random_headlines.json"), mode="r") as f:
         data = json.load(f)
@@ -128,8 +271,13 @@ def evaluate_print():
     total_headlines = len(headlines)
     labels = [item["sentiment"] for item in data]
 
-    with open(os.path.join("data", "benchmark", "qwen.json")) as f:
-        results = json.load(f)
+    # Later records of an index (e.g. retried failures) override earlier ones
+    predictions = {}
+    for i, result in iter_results(results_path):
+        predictions[i] = (
+            result.get("sentiment", ""),
+            result.get("confidence", result.get("error")),
+        )
 
     correct = 0
     with open(
@@ -138,18 +286,51 @@ def evaluate_print():
     ) as f:
         print(f"Model: {model_path} through Ollama\n", file=f)
 
-        for headline, label, result in zip(headlines, labels, results):
-            if label.lower() == result["sentiment"].lower():
+        for i, (headline, label) in enumerate(zip(headlines, labels)):
+            # Headlines that failed or weren't labelled count as misclassified
+            predicted, confidence = predictions.get(i, ("", "not labelled"))
+            if label.lower() == predicted.lower():
                 correct += 1
 
             else:
                 print(f"{headline}", file=f)
-                print(f"\tExpected: {label}\tPredicted: {result['sentiment']}", file=f)
-                print(f"\t\t{result['confidence']}", file=f)
+                print(f"\tExpected: {label}\tPredicted: {predicted}", file=f)
+                print(f"\t\t{confidence}", file=f)
 
         print("\nAccuracy:", correct / total_headlines, file=f)
 
 
 if __name__ == "__main__":
-    asyncio.run(ollama_predict())
+    parser = argparse.ArgumentParser(description="Benchmark Qwen through Ollama")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Requests in flight, match the server's OLLAMA_NUM_PARALLEL",
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=1, help="Headlines packed into one prompt"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=300.0, help="Per-request timeout in seconds"
+    )
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help=f"Only label headlines missing from {RESULTS_PATH}",
+    )
+    args = parser.parse_args()
+
+    asyncio.run(
+        ollama_predict(
+            args.host,
+            args.concurrency,
+            args.batch_size,
+            args.timeout,
+            args.retries,
+            args.resume,
+        )
+    )
     evaluate_print()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Benchmark the transfer entropy stage on synthetic panels.
+
+For every combination of panel size (tickers x days) a synthetic panel with
+planted sentiment -> returns couplings is generated (see
+generate_synthetic_panel.py). The script times transfer_entropy.prepare_data()
+and the IDTxl network analysis for every kraskov_k / permutation count and
+reports throughput together with the recall of the planted edges.
+"""
+
+import argparse
+import itertools
+import os
+import tempfile
+import time
+
+import pandas as pd
+from idtxl.data import Data
+from idtxl.multivariate_te import MultivariateTE
+
+from generate_synthetic_panel import generate_panel, write_panel
+from transfer_entropy import SETTINGS, prepare_data, resolve_estimator
+
+
+def planted_edge_recall(results, columns: list[str], edges: list[dict]) -> dict:
+    """
+    Compare the inferred (FDR uncorrected) sources with the planted edges.
+
+    Args:
+        results: IDTxl network inference results
+        columns: Column names of the analysed panel, in process order
+        edges: Planted edges as written by generate_synthetic_panel.py
+
+    Returns:
+        Dictionary with recall (any lag), lag recall and precision
+    """
+    index = {column: i for i, column in enumerate(columns)}
+    planted = {(index[e["source"]], index[e["target"]]): e["lag"] for e in edges}
+
+    found, found_lag, inferred = 0, 0, 0
+    for target in results.targets_analysed:
+        selected = results.get_single_target(target, fdr=False)["selected_vars_sources"]
+        sources = {process for process, _ in selected}
+        inferred += len(sources)
+
+        for process, lag in selected:
+            if planted.get((process, target)) == lag:
+                found_lag += 1
+
+        found += sum((source, target) in planted for source in sources)
+
+    return {
+        "recall": found / len(planted) if planted else float("nan"),
+        "lag_recall": found_lag / len(planted) if planted else float("nan"),
+        "precision": found / inferred if inferred else float("nan"),
+    }
+
+
+def run_te(df: pd.DataFrame, settings: dict, targets: list[int] | str = "all"):
+    data = Data(df, dim_order="sp")
+    network_analysis = MultivariateTE()
+    return network_analysis.analyse_network(
+        settings=resolve_estimator(dict(settings)), data=data, targets=targets
+    )
+
+
+def benchmark(
+    tickers: list[int],
+    days: list[int],
+    kraskov_ks: list[int],
+    n_perms: list[int],
+    estimator: str,
+    max_lag: int,
+    returns_targets_only: bool,
+    seed: int,
+) -> pd.DataFrame:
+    rows = []
+
+    for n_tickers, n_days in itertools.product(tickers, days):
+        frames, edges = generate_panel(n_tickers, n_days, max_lag=max_lag, seed=seed)
+
+        with tempfile.TemporaryDirectory() as panel_dir:
+            write_panel(panel_dir, frames, edges)
+
+            start = time.perf_counter()
+            df = prepare_data(panel_dir, verbose=False)
+            prepare_time = time.perf_counter() - start
+
+        columns = list(df.columns)
+        if returns_targets_only:
+            targets = [i for i, c in enumerate(columns) if c.endswith("_LOG_RETURNS")]
+        else:
+            targets = list(range(len(columns)))
+
+        for kraskov_k, n_perm in itertools.product(kraskov_ks, n_perms):
+            settings = dict(SETTINGS)
+            settings.update(
+                {
+                    "cmi_estimator": estimator,
+                    "kraskov_k": kraskov_k,
+                    "max_lag_sources": max_lag,
+                    "max_lag_target": max_lag,
+                    "n_perm_max_stat": n_perm,
+                    "n_perm_min_stat": n_perm,
+                    "n_perm_omnibus": n_perm,
+                    "n_perm_max_seq": n_perm,
+                    "verbose": False,
+                }
+            )
+
+            print(
+                f"Tickers: {n_tickers}, days: {n_days}, kraskov_k: {kraskov_k}, "
+                f"n_perm: {n_perm}..."
+            )
+            start = time.perf_counter()
+            results = run_te(df, settings, targets)
+            te_time = time.perf_counter() - start
+
+            row = {
+                "tickers": n_tickers,
+                "days": n_days,
+                "processes": len(columns),
+                "targets": len(targets),
+                "kraskov_k": kraskov_k,
+                "n_perm": n_perm,
+                "prepare_s": prepare_time,
+                "te_s": te_time,
+                "targets_per_s": len(targets) / te_time,
+                "samples_per_s": len(targets) * len(df) / te_time,
+                **planted_edge_recall(results, columns, edges),
+            }
+            print(
+                f"\tTE time: {te_time:.1f} s, recall: {row['recall']:.2f}, "
+                f"lag recall: {row['lag_recall']:.2f}, precision: {row['precision']:.2f}"
+            )
+            rows.append(row)
+
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tickers", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--days", type=int, nargs="+", default=[250, 417])
+    parser.add_argument("--kraskov-k", type=int, nargs="+", default=[4])
+    parser.add_argument("--n-perm", type=int, nargs="+", default=[100])
+    parser.add_argument("--estimator", default="JidtKraskovCMI")
+    parser.add_argument("--max-lag", type=int, default=3)
+    parser.add_argument(
+        "--all-targets",
+        action="store_true",
+        help="Analyse sentiment targets too, not only the returns",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--out", default=os.path.join("data", "benchmark", "transfer_entropy.csv")
+    )
+    args = parser.parse_args()
+
+    report = benchmark(
+        args.tickers,
+        args.days,
+        args.kraskov_k,
+        args.n_perm,
+        args.estimator,
+        args.max_lag,
+        not args.all_targets,
+        args.seed,
+    )
+
+    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    report.to_csv(args.out, index=False)
+
+    print(report.to_string(index=False))
+    print(f"\nBenchmark saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
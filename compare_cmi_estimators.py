@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Compare the speed and bias of CMI estimators on sentiment -> returns pairs.
+
+For every pair of a SENTIMENT source and a LOG_RETURNS target, the CMI between
+the lagged source and the target conditioned on the target's past is estimated
+the same way IDTxl estimates it for a single candidate, once on the data and
+on shuffled surrogates of the source. The mean surrogate estimate is the bias
+of the estimator (the true value is 0), the 95% surrogate quantile gives the
+detection threshold. On synthetic panels the planted edges tell which pairs
+should be detected.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from idtxl.estimator import find_estimator
+
+from generate_synthetic_panel import generate_panel, write_panel
+from transfer_entropy import SETTINGS, prepare_data, resolve_estimator
+
+
+def make_estimator(name: str, settings: dict):
+    settings = resolve_estimator({**settings, "cmi_estimator": name})
+    estimator_class = settings["cmi_estimator"]
+    if isinstance(estimator_class, str):
+        estimator_class = find_estimator(estimator_class)
+    return estimator_class(settings)
+
+
+def embed_pair(
+    df: pd.DataFrame, source: str, target: str, lag: int, target_lags: int
+):
+    """Source at t - lag, target at t and the target's past as the conditional."""
+    # IDTxl normalises every process before the analysis
+    values = (df - df.mean()) / df.std()
+    start = max(lag, target_lags)
+
+    x = values[source].to_numpy()[start - lag : len(df) - lag]
+    y = values[target].to_numpy()[start:]
+    z = np.column_stack(
+        [
+            values[target].to_numpy()[start - l : len(df) - l]
+            for l in range(1, target_lags + 1)
+        ]
+    )
+    return x, y, z
+
+
+def compare_panel(
+    name: str,
+    df: pd.DataFrame,
+    estimators: list[str],
+    settings: dict,
+    lag: int,
+    target_lags: int,
+    n_surrogates: int,
+    max_pairs: int,
+    planted: set[tuple[str, str]],
+    seed: int,
+) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    sources = [c for c in df.columns if c.endswith("_SENTIMENT")]
+    targets = [c for c in df.columns if c.endswith("_LOG_RETURNS")]
+
+    # Planted pairs first so that they are never cut off by max_pairs
+    pairs = [(s, t) for s in sources for t in targets]
+    pairs.sort(key=lambda pair: pair not in planted)
+    pairs = pairs[:max_pairs]
+
+    instances = {e: make_estimator(e, settings) for e in estimators}
+
+    rows = []
+    for source, target in pairs:
+        x, y, z = embed_pair(df, source, target, lag, target_lags)
+        shuffles = [rng.permutation(len(x)) for _ in range(n_surrogates)]
+
+        for estimator_name, estimator in instances.items():
+            start = time.perf_counter()
+            value = estimator.estimate(var1=x, var2=y, conditional=z)
+            surrogates = [
+                estimator.estimate(var1=x[s], var2=y, conditional=z) for s in shuffles
+            ]
+            elapsed = time.perf_counter() - start
+
+            rows.append(
+                {
+                    "panel": name,
+                    "estimator": estimator_name,
+                    "source": source,
+                    "target": target,
+                    "planted": (source, target) in planted,
+                    "cmi": value,
+                    "null_mean": np.mean(surrogates),
+                    "null_std": np.std(surrogates),
+                    "detected": value > np.quantile(surrogates, 0.95),
+                    "ms_per_estimate": elapsed / (n_surrogates + 1) * 1000,
+                }
+            )
+
+        print(f"\t{source} -> {target} done")
+
+    return pd.DataFrame(rows)
+
+
+def summarise(report: pd.DataFrame) -> pd.DataFrame:
+    return report.groupby(["panel", "estimator", "planted"]).agg(
+        pairs=("cmi", "size"),
+        ms_per_estimate=("ms_per_estimate", "mean"),
+        cmi=("cmi", "mean"),
+        bias=("null_mean", "mean"),
+        null_std=("null_std", "mean"),
+        detection_rate=("detected", "mean"),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--estimators",
+        nargs="+",
+        default=[SETTINGS["cmi_estimator"], "MixedKraskovCMI"],
+    )
+    parser.add_argument("--aggregate-dir", default=os.path.join("data", "aggregate"))
+    parser.add_argument("--tickers", type=int, default=8)
+    parser.add_argument("--days", type=int, default=417)
+    parser.add_argument("--lag", type=int, default=1)
+    parser.add_argument("--target-lags", type=int, default=1)
+    parser.add_argument("--n-surrogates", type=int, default=50)
+    parser.add_argument("--max-pairs", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--out", default=os.path.join("data", "benchmark", "cmi_estimators.csv")
+    )
+    args = parser.parse_args()
+
+    settings = dict(SETTINGS)
+
+    panels = []
+    frames, edges = generate_panel(
+        args.tickers, args.days, max_lag=args.lag, seed=args.seed
+    )
+    with tempfile.TemporaryDirectory() as panel_dir:
+        write_panel(panel_dir, frames, edges)
+        synthetic = prepare_data(panel_dir, verbose=False)
+    planted = {(e["source"], e["target"]) for e in edges if e["lag"] == args.lag}
+    panels.append(("synthetic", synthetic, planted))
+
+    if os.path.isdir(args.aggregate_dir):
+        panels.append(("real", prepare_data(args.aggregate_dir, verbose=False), set()))
+    else:
+        print(f"{args.aggregate_dir} not found, comparing on the synthetic panel only")
+
+    reports = []
+    for name, df, planted in panels:
+        print(
+            f"Comparing on the {name} panel ({df.shape[1]} processes, {len(df)} days)"
+        )
+        reports.append(
+            compare_panel(
+                name,
+                df,
+                args.estimators,
+                settings,
+                args.lag,
+                args.target_lags,
+                args.n_surrogates,
+                args.max_pairs,
+                planted,
+                args.seed,
+            )
+        )
+
+    report = pd.concat(reports, ignore_index=True)
+    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    report.to_csv(args.out, index=False)
+
+    print(summarise(report).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Cluster near-duplicate headlines with MinHash/LSH before sentiment inference.
+
+Syndicated rewrites, "UPDATE 1/2/3" versions and copies of the same story under
+several RICs all end up in different files of data/headlines/. This module
+groups them across all tickers into clusters of near-duplicates, so that only
+one representative per cluster needs to go through FinBERT and its label can
+be fanned back out to all members.
+
+The LSH index lives in SQLite (in memory or on disk), only representatives are
+indexed and headlines are processed file by file in chunks, which keeps the
+memory bounded even for tens of millions of headlines.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import zlib
+
+import numpy as np
+
+# Mersenne prime 2^31 - 1, small enough that a * h + b doesn't overflow uint64
+PRIME = np.uint64((1 << 31) - 1)
+
+# Prefixes of follow-up versions of the same story
+VERSION_PREFIX = re.compile(
+    r"^((update|corrected|rpt|refile|brief|buzz|exclusive)(\s*\d+)?\s*-\s*)+"
+)
+
+CHUNK_SIZE = 50_000
+
+# Kept across runs, so that clusters and labels of old headlines are reused
+INDEX_PATH = os.path.join("data", ".dedup_index.sqlite")
+
+
+def normalise_headline(text: str) -> str:
+    text = VERSION_PREFIX.sub("", text.lower().strip())
+    return re.sub(r"[^0-9a-z]+", " ", text).strip()
+
+
+def shingle_hashes(normalised: str) -> list[int]:
+    """Hashes of word bigrams, or of the single word of one-word headlines."""
+    words = normalised.split()
+    if len(words) < 2:
+        return [zlib.crc32(normalised.encode("utf-8"))]
+
+    return [
+        zlib.crc32(f"{a} {b}".encode("utf-8")) for a, b in zip(words, words[1:])
+    ]
+
+
+class NearDuplicateIndex:
+    """
+    Greedy MinHash/LSH clustering of headlines.
+
+    Every headline is compared against the representatives of existing clusters
+    that share at least one LSH band with it. It joins the first one whose
+    estimated Jaccard similarity reaches the threshold, or becomes the
+    representative of a new cluster.
+    """
+
+    def __init__(
+        self,
+        path: str = INDEX_PATH,
+        num_perm: int = 60,
+        bands: int = 10,
+        threshold: float = 0.8,
+        seed: int = 0,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, PRIME, size=num_perm, dtype=np.uint64)
+        self.band_mix = rng.integers(1, 1 << 62, size=self.rows, dtype=np.uint64)
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path)
+        # A crash must not corrupt an index that is reused by later runs
+        self.db.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            PRAGMA cache_size = -65536;
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS reps (
+                id INTEGER PRIMARY KEY,
+                text TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                label TEXT,
+                score REAL
+            );
+            CREATE TABLE IF NOT EXISTS bands (
+                band INTEGER,
+                key INTEGER,
+                rep INTEGER,
+                PRIMARY KEY (band, key)
+            ) WITHOUT ROWID;
+            -- Keyed on 32-bit CRCs before, which let unequal texts collide
+            DROP TABLE IF EXISTS exact;
+            CREATE TABLE IF NOT EXISTS exact_digests (
+                key BLOB PRIMARY KEY,
+                rep INTEGER
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS members (
+                file TEXT,
+                position INTEGER,
+                rep INTEGER,
+                PRIMARY KEY (file, position)
+            ) WITHOUT ROWID;
+            """
+        )
+
+        # Signatures and band keys of other settings are not comparable
+        settings = json.dumps({"num_perm": num_perm, "bands": bands, "seed": seed})
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'minhash'").fetchone()
+        if row is None:
+            self.db.execute("INSERT INTO meta VALUES ('minhash', ?)", (settings,))
+            self.db.commit()
+        elif row[0] != settings:
+            raise ValueError(
+                f"Index {path} was built with MinHash settings {row[0]}, "
+                "delete it or use another path"
+            )
+
+    def use_model(self, model: str) -> None:
+        """Drop the labels of representatives scored by another model."""
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'model'").fetchone()
+        if row is not None and row[0] != model:
+            print(f"Index labelled by {row[0]}, relabelling with {model}")
+            self.db.execute("UPDATE reps SET label = NULL, score = NULL")
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES ('model', ?)", (model,))
+        self.db.commit()
+
+    def signatures(self, normalised: list[str]) -> np.ndarray:
+        """MinHash signatures of a batch of normalised headlines, (n, num_perm)."""
+        shingles = [shingle_hashes(text) for text in normalised]
+        lengths = np.fromiter((len(s) for s in shingles), dtype=np.int64)
+        hashes = np.fromiter(
+            (h for s in shingles for h in s), dtype=np.uint64, count=lengths.sum()
+        )
+
+        # Permute all shingles at once and take the minimum per headline
+        permuted = (hashes[:, None] % PRIME * self.a + self.b) % PRIME
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        return np.minimum.reduceat(permuted, starts, axis=0)
+
+    def band_keys(self, signatures: np.ndarray) -> np.ndarray:
+        banded = signatures.reshape(len(signatures), self.bands, self.rows)
+        # Wrapping uint64 arithmetic is fine for hashing
+        keys = (banded * self.band_mix).sum(axis=2)
+        return keys.view(np.int64)
+
+    def add(self, file: str, texts: list[str]) -> np.ndarray:
+        """
+        Assign headlines of one file to clusters.
+
+        Args:
+            file: Name the assignments are stored under
+            texts: Headline texts in file order
+
+        Returns:
+            Array with the representative id of every headline
+        """
+        reps = np.empty(len(texts), dtype=np.int64)
+
+        for start in range(0, len(texts), CHUNK_SIZE):
+            chunk = texts[start : start + CHUNK_SIZE]
+            normalised = [normalise_headline(text) for text in chunk]
+            signatures = self.signatures(normalised)
+            keys = self.band_keys(signatures)
+
+            for i, text in enumerate(chunk):
+                reps[start + i] = self._assign(
+                    text, normalised[i], signatures[i], keys[i]
+                )
+
+        self.db.executemany(
+            "INSERT OR REPLACE INTO members VALUES (?, ?, ?)",
+            ((file, i, int(rep)) for i, rep in enumerate(reps)),
+        )
+        self.db.commit()
+        return reps
+
+    def _assign(self, text, normalised, signature, keys) -> int:
+        # Wide enough that unequal texts never share a key
+        exact_key = hashlib.blake2b(normalised.encode("utf-8"), digest_size=16).digest()
+        row = self.db.execute(
+            "SELECT rep FROM exact_digests WHERE key = ?", (exact_key,)
+        ).fetchone()
+        if row:
+            return row[0]
+
+        candidates = {
+            row[0]
+            for band, key in enumerate(keys.tolist())
+            for row in self.db.execute(
+                "SELECT rep FROM bands WHERE band = ? AND key = ?", (band, key)
+            )
+        }
+        for rep in sorted(candidates):
+            (blob,) = self.db.execute(
+                "SELECT signature FROM reps WHERE id = ?", (rep,)
+            ).fetchone()
+            similarity = np.mean(np.frombuffer(blob, dtype=np.uint64) == signature)
+            if similarity >= self.threshold:
+                self.db.execute(
+                    "INSERT OR IGNORE INTO exact_digests VALUES (?, ?)",
+                    (exact_key, rep),
+                )
+                return rep
+
+        # New cluster with this headline as its representative
+        rep = self.db.execute(
+            "INSERT INTO reps (text, signature) VALUES (?, ?)",
+            (text, signature.tobytes()),
+        ).lastrowid
+        self.db.executemany(
+            "INSERT OR IGNORE INTO bands VALUES (?, ?, ?)",
+            ((band, key, rep) for band, key in enumerate(keys.tolist())),
+        )
+        self.db.execute(
+            "INSERT OR IGNORE INTO exact_digests VALUES (?, ?)", (exact_key, rep)
+        )
+        return rep
+
+    def unlabelled(self, batch_size: int):
+        """Yield (ids, texts) of representatives that still need inference."""
+        last_id = 0
+        while True:
+            rows = self.db.execute(
+                "SELECT id, text FROM reps WHERE label IS NULL AND id > ? "
+                "ORDER BY id LIMIT ?",
+                (last_id, batch_size),
+            ).fetchall()
+            if not rows:
+                return
+
+            last_id = rows[-1][0]
+            yield [row[0] for row in rows], [row[1] for row in rows]
+
+    def set_labels(self, ids: list[int], results: list[dict]) -> None:
+        self.db.executemany(
+            "UPDATE reps SET label = ?, score = ? WHERE id = ?",
+            ((r["label"], r["score"], i) for i, r in zip(ids, results)),
+        )
+        self.db.commit()
+
+    def member_labels(self, file: str) -> list[tuple[str, float]]:
+        return self.db.execute(
+            "SELECT r.label, r.score FROM members m JOIN reps r ON m.rep = r.id "
+            "WHERE m.file = ? ORDER BY m.position",
+            (file,),
+        ).fetchall()
+
+    def stats(self) -> dict:
+        headlines, clusters, largest, duplicated = self.db.execute(
+            "SELECT SUM(size), COUNT(*), MAX(size), SUM(size > 1) FROM "
+            "(SELECT COUNT(*) AS size FROM members GROUP BY rep)"
+        ).fetchone()
+        headlines = headlines or 0
+
+        return {
+            "headlines": headlines,
+            "clusters": clusters,
+            "clusters_with_duplicates": duplicated or 0,
+            "largest_cluster": largest or 0,
+            "mean_cluster_size": headlines / clusters if clusters else 0.0,
+            "inference_calls_saved": headlines - clusters,
+        }
+
+
+def build_index(in_folder: str, index: NearDuplicateIndex) -> list[str]:
+    files = sorted(f for f in os.listdir(in_folder) if f.endswith(".json"))
+
+    for file in files:
+        with open(os.path.join(in_folder, file), mode="r") as f:
+            texts = [sample["text"] for sample in json.load(f)]
+
+        index.add(file, texts)
+        print(f"\tIndexed {file} ({len(texts)} headlines)")
+
+    return files
+
+
+def print_stats(stats: dict) -> None:
+    print("\n" + "=" * 60)
+    print("NEAR-DUPLICATE CLUSTERS")
+    print("=" * 60)
+    print(f"Headlines: {stats['headlines']:,}")
+    print(f"Clusters: {stats['clusters']:,}")
+    print(f"Clusters with duplicates: {stats['clusters_with_duplicates']:,}")
+    print(f"Largest cluster: {stats['largest_cluster']:,}")
+    print(f"Mean cluster size: {stats['mean_cluster_size']:.2f}")
+    saved_pct = (
+        stats["inference_calls_saved"] / stats["headlines"] * 100
+        if stats["headlines"]
+        else 0.0
+    )
+    print(
+        f"Inference calls saved: {stats['inference_calls_saved']:,} ({saved_pct:.1f}%)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--input-dir", default=os.path.join("data", "headlines"))
+    parser.add_argument(
+        "--index-path",
+        default=INDEX_PATH,
+        help='SQLite file of the index, ":memory:" to not keep it',
+    )
+    parser.add_argument("--threshold", type=float, default=0.8)
+    args = parser.parse_args()
+
+    index = NearDuplicateIndex(args.index_path, threshold=args.threshold)
+    build_index(args.input_dir, index)
+    print_stats(index.stats())
+
+
+if __name__ == "__main__":
+    main()
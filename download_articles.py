@@ -5,6 +5,8 @@ import time
 import eikon as ek
 from dotenv import load_dotenv
 
+from headline_store import headline_files, load_records
+
 
 def get_story(id: str, max_retries: int = 10) -> None:
     retries = 0
@@ -31,28 +33,25 @@ def main() -> None:
 
     in_dir = os.path.join("data", "filtered_headlines")
 
-    for i, file in enumerate(sorted(os.listdir(in_dir))):
-        if not file.endswith(".json"):
-            continue
+    for i, file in enumerate(headline_files(in_dir)):
         print(f"Processing file {i}: {file}")
 
         ric = file.split("_")[0]
 
-        with open(os.path.join(in_dir, file)) as f:
-            headlines = json.load(f)
-            stories = []
+        headlines = load_records(os.path.join(in_dir, file))
+        stories = []
 
-            for j, headline in enumerate(headlines):
-                if j % 100 == 0:
-                    print(f"\tProcessing headline {j}/{len(headlines)}")
+        for j, headline in enumerate(headlines):
+            if j % 100 == 0:
+                print(f"\tProcessing headline {j}/{len(headlines)}")
 
-                id = headline["storyId"]
-                stories.append(get_story(id))
+            id = headline["storyId"]
+            stories.append(get_story(id))
 
-            with open(
-                os.path.join(out_dir, f"{ric}_stories.json"), "w", encoding="utf-8"
-            ) as f:
-                json.dump(stories, f, indent=2, ensure_ascii=False)
+        with open(
+            os.path.join(out_dir, f"{ric}_stories.json"), "w", encoding="utf-8"
+        ) as f:
+            json.dump(stories, f, indent=2, ensure_ascii=False)
 
 
 if __name__ == "__main__":
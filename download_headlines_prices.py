@@ -1,20 +1,29 @@
+import argparse
 import datetime
 import json
 import os
 import re
 import time
 
-import eikon as ek
 import pandas as pd
-from dotenv import load_dotenv
+
+from price_store import MAX_POINTS, refresh_prices
 
 # Use the STOXX 50 (wide, not eurozone only) index
 INDEX_RIC = ".STOXX50"
 
+# Dates of our first and last headlines
+HEADLINES_START = datetime.date(2023, 10, 23)
+HEADLINES_END = datetime.date(2025, 6, 14)
+# Upper bound of the minute bars of one trading day, sessions are 8.5-9 h
+MINUTES_PER_SESSION = 600
+
 
 def get_headlines_one_batch(
     rics: list[str], date_from: datetime.datetime, date_to: datetime.datetime
 ) -> list[dict]:
+    import eikon as ek
+
     query_build = [f"R:{ric}" for ric in rics]
     query_build = " OR ".join(query_build)
 
@@ -94,31 +103,34 @@ def download_instrument_headlines(
 
 
 def get_instrument_stock_prices(
-    instrument_ric: str, max_retries: int = 10
-) -> pd.DataFrame:
+    instrument_ric: str,
+    max_retries: int = 10,
+    interval: str = "daily",
+    start: datetime.date = HEADLINES_START,
+    end: datetime.date = HEADLINES_END,
+) -> pd.DataFrame | None:
+    """Closes between start and end, empty if there are none, None on failure."""
+    import eikon as ek
+
     retries = 0
     while retries < max_retries:
         try:
             res = ek.get_timeseries(
                 rics=instrument_ric,
-                start_date=datetime.datetime(
-                    2023, 10, 23
-                ),  # Date of our first headlines
-                end_date=datetime.datetime(
-                    2025, 6, 14, 23, 59, 59
-                ),  # Date of our last headlines
-                interval="daily",
+                start_date=datetime.datetime.combine(start, datetime.time()),
+                end_date=datetime.datetime.combine(end, datetime.time(23, 59, 59)),
+                interval=interval,
                 fields=["TIMESTAMP", "CLOSE"],
                 calendar="tradingdays",
                 corax="adjusted",
             )
-
-            if res is None or res.empty:
-                raise ValueError(f"No data returned for {instrument_ric}")
-
-            return res
+            return pd.DataFrame(columns=["CLOSE"]) if res is None else res
 
         except Exception as e:
+            # No bars in the window, e.g. before the intraday history starts
+            if isinstance(e, ek.EikonError) and e.code == -1:
+                return pd.DataFrame(columns=["CLOSE"])
+
             retries += 1
             print(f"Error getting stock prices for {instrument_ric}: {e}")
             print(f"Retrying... ({retries}/{max_retries})")
@@ -130,6 +142,19 @@ def get_instrument_stock_prices(
     )
 
 
+def fix_json_file(filepath: str) -> None:
+    # Read the file content
+    with open(filepath, "r", encoding="utf-8") as file:
+        content = file.read()
+
+    # Fix the trailing comma issue: replace },] with }] (handling arbitrary whitespace)
+    fixed_content = re.sub(r"},\s*]$", "}\n]", content)
+
+    # Write the fixed content back to the file
+    with open(filepath, "w", encoding="utf-8") as file:
+        file.write(fixed_content)
+
+
 def fix_json_files(directory: str = os.path.join("data", "headlines")) -> None:
     # Check if directory exists
     if not os.path.exists(directory):
@@ -142,24 +167,83 @@ def fix_json_files(directory: str = os.path.join("data", "headlines")) -> None:
             filepath = os.path.join(directory, filename)
 
             try:
-                # Read the file content
-                with open(filepath, "r", encoding="utf-8") as file:
-                    content = file.read()
-
-                # Fix the trailing comma issue: replace },] with }] (handling arbitrary whitespace)
-                fixed_content = re.sub(r"},\s*]$", "}\n]", content)
-
-                # Write the fixed content back to the file
-                with open(filepath, "w", encoding="utf-8") as file:
-                    file.write(fixed_content)
-
+                fix_json_file(filepath)
                 print(f"Fixed: {filename}")
 
             except Exception as e:
                 print(f"Error processing {filename}: {e}")
 
 
+def download_instrument(
+    ric: str,
+    all_rics: list[str],
+    headlines_dir: str = os.path.join("data", "headlines"),
+    prices_dir: str = os.path.join("data", "prices"),
+    prices: bool = True,
+) -> None:
+    download_instrument_headlines(ric, all_rics, out_dir=headlines_dir)
+    fix_json_file(
+        os.path.join(headlines_dir, f"{ric.replace('.', '-')}_headlines.json")
+    )
+
+    if prices:
+        # Only the bars after the last stored one, with close timestamps
+        refresh_prices([ric], prices_dir=prices_dir)
+        print("Downloaded stock price data")
+
+
+def download_intraday_prices(
+    ric: str, prices_dir: str = os.path.join("data", "prices_intraday")
+) -> None:
+    """
+    Minute closes for the intraday bars of aggregate_multifreq.py.
+
+    Eikon returns at most MAX_POINTS bars per request, so the headline period is
+    requested in windows of a few days. Eikon only keeps a limited intraday
+    history, the range actually received is printed.
+    """
+    os.makedirs(prices_dir, exist_ok=True)
+    window = datetime.timedelta(days=max(MAX_POINTS // MINUTES_PER_SESSION, 1))
+
+    chunks, failed = [], 0
+    start = HEADLINES_START
+    while start <= HEADLINES_END:
+        end = min(start + window - datetime.timedelta(days=1), HEADLINES_END)
+        chunk = get_instrument_stock_prices(
+            ric, interval="minute", start=start, end=end
+        )
+        if chunk is None:
+            failed += 1
+        elif not chunk.empty:
+            chunks.append(chunk)
+        start = end + datetime.timedelta(days=1)
+
+    if not chunks:
+        print(f"No intraday prices for {ric}")
+        return
+
+    prices = pd.concat(chunks).sort_index()
+    prices = prices[~prices.index.duplicated()]
+    prices.to_csv(os.path.join(prices_dir, f"{ric.replace('.', '-')}.csv"), index=True)
+    print(
+        f"Downloaded {len(prices)} minute closes of {ric} from "
+        f"{prices.index.min()} to {prices.index.max()}"
+        + (f", {failed} windows failed" if failed else "")
+    )
+
+
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Download headlines and prices")
+    parser.add_argument(
+        "--intraday",
+        action="store_true",
+        help="Also download minute prices for the multi-frequency aggregation",
+    )
+    args = parser.parse_args()
+
+    import eikon as ek
+    from dotenv import load_dotenv
+
     load_dotenv()
     ek.set_app_key(os.getenv("EIKON_APP_KEY"))
 
@@ -173,18 +257,17 @@ def main() -> None:
         print("Download the constituents of the index with rics first.")
         exit()
 
-    # Download headlines and stock prices for each constituent
+    # Download headlines for each constituent
     for _, row in constituents.iterrows():
         ric, all_rics = row["Instrument"], row["All RICs"].split(";")
         print(f"\n\nInstrument: {ric}")
 
-        download_instrument_headlines(ric, all_rics)
+        download_instrument(ric, all_rics, prices=False)
+        if args.intraday:
+            download_intraday_prices(ric)
 
-        # We're getting prices one by one to avoid hitting API limits
-        get_instrument_stock_prices(ric).to_csv(
-            os.path.join("data", "prices", f"{ric.replace('.', '-')}.csv"), index=True
-        )
-        print("Downloaded stock price data")
+    # Stock prices of all constituents in a few bulk requests
+    refresh_prices(constituents["Instrument"].tolist())
 
     # Fix the generated JSON files
     fix_json_files()
@@ -1,3 +1,4 @@
+import argparse
 import os
 
 import eikon as ek
@@ -5,9 +6,15 @@ import pandas as pd
 from dotenv import load_dotenv
 from eikon import TR_Field
 
+from add_timestamps import get_exchanges
+from eikon_cache import CACHE_PATH, DEFAULT_TTL_S, ResponseCache
+
 # Use the STOXX 50 (wide, not eurozone only) index
 INDEX_RIC = ".STOXX50"
 
+# Symbols converted per symbology request
+SYMBOLOGY_CHUNK = 1000
+
 
 def get_constituents_of_index(index_ric: str) -> pd.DataFrame:
     print("Getting constituents for index:", index_ric)
@@ -40,28 +47,78 @@ def get_constituents_of_index(index_ric: str) -> pd.DataFrame:
     return details
 
 
-def find_all_rics(main_ric: str) -> list[str]:
-    print("Getting all RICs for original main RIC:", main_ric)
-    isin = ek.get_symbology(main_ric, from_symbol_type="RIC", to_symbol_type="ISIN")[
-        "ISIN"
-    ].iloc[0]
-    return ek.get_symbology(
-        isin, from_symbol_type="ISIN", to_symbol_type="RIC", best_match=False
-    )["RICs"].iloc[0]
+def convert_symbols(
+    symbols: list[str], from_type: str, to_type: str, column: str, best_match=True
+) -> dict:
+    """Converted symbols, those without a match are left out."""
+    converted = {}
+    for start in range(0, len(symbols), SYMBOLOGY_CHUNK):
+        chunk = symbols[start : start + SYMBOLOGY_CHUNK]
+        print(f"Converting {len(chunk)} symbols from {from_type} to {to_type}")
+        df = ek.get_symbology(
+            chunk,
+            from_symbol_type=from_type,
+            to_symbol_type=to_type,
+            best_match=best_match,
+        )
+        if column in df.columns:
+            converted.update(df[column].dropna().items())
+    return converted
+
+
+def find_all_rics(main_rics: list[str], cache: ResponseCache) -> dict[str, list[str]]:
+    """
+    RICs of all listings of every main RIC, resolved for all instruments at once
+    (RIC -> ISIN, then ISIN -> all RICs) except for the ones cached.
+    """
+    isins = cache.lookup(
+        "ric_isin",
+        main_rics,
+        lambda rics: convert_symbols(rics, "RIC", "ISIN", "ISIN"),
+    )
+    rics_by_isin = cache.lookup(
+        "isin_rics",
+        list(isins.values()),
+        lambda isins: convert_symbols(isins, "ISIN", "RIC", "RICs", best_match=False),
+    )
+
+    return {
+        ric: list(rics_by_isin[isins[ric]])
+        for ric in main_rics
+        if ric in isins and isins[ric] in rics_by_isin
+    }
 
 
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Download the index constituents")
+    parser.add_argument("--index", default=INDEX_RIC)
+    parser.add_argument("--cache-path", default=CACHE_PATH)
+    parser.add_argument(
+        "--ttl-days",
+        type=float,
+        default=DEFAULT_TTL_S / (24 * 3600),
+        help="Age after which cached symbology and exchanges are requested again",
+    )
+    args = parser.parse_args()
+
     load_dotenv()
     ek.set_app_key(os.getenv("EIKON_APP_KEY"))
 
     constituents_path = os.path.join("data", "constituents.csv")
+    cache = ResponseCache(args.cache_path, args.ttl_days * 24 * 3600)
+
+    constituents = get_constituents_of_index(args.index)
+    main_rics = constituents["Instrument"].tolist()
 
-    constituents = get_constituents_of_index(INDEX_RIC)
+    all_rics = find_all_rics(main_rics, cache)
+    for ric in main_rics:
+        if ric not in all_rics:
+            print(f"No RICs found for {ric}, keeping only the main RIC")
+    # Add the rics to the dataframe as new column
+    constituents["All RICs"] = [";".join(all_rics.get(ric, [ric])) for ric in main_rics]
 
-    for i, main_ric in enumerate(constituents["Instrument"]):
-        all_rics = find_all_rics(main_ric)
-        # Add the rics to the dataframe as new column
-        constituents.loc[i, "All RICs"] = ";".join(all_rics)
+    # Exchanges for add_timestamps.py are cached in the same request round
+    get_exchanges(main_rics, cache)
 
     # Save the data
     constituents.to_csv(constituents_path, index=False)
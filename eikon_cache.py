@@ -0,0 +1,85 @@
+"""
+Persistent cache of Eikon reference data responses.
+
+Symbology (RIC -> ISIN -> all RICs) and exchange codes hardly ever change, yet
+download_rics.py and add_timestamps.py asked Eikon for them instrument by
+instrument on every run. Responses are stored per namespace and key in SQLite
+(data/.eikon_cache.sqlite) and reused until they are older than the TTL, so
+only instruments that are new or stale are requested, all of them at once.
+"""
+
+import json
+import os
+import sqlite3
+import time
+
+CACHE_PATH = os.path.join("data", ".eikon_cache.sqlite")
+# Reference data is refreshed weekly
+DEFAULT_TTL_S = 7 * 24 * 3600
+
+
+class ResponseCache:
+    def __init__(self, path: str = CACHE_PATH, ttl_s: float = DEFAULT_TTL_S):
+        """
+        Args:
+            path: SQLite file shared by all scripts, ":memory:" for no persistence
+            ttl_s: Age in seconds after which cached responses are fetched again
+        """
+        self.ttl_s = ttl_s
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Pipeline workers may write at the same time
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                namespace TEXT,
+                key TEXT,
+                value TEXT NOT NULL,
+                fetched REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            ) WITHOUT ROWID
+            """
+        )
+
+    def get_many(self, namespace: str, keys: list[str]) -> dict:
+        """Fresh cached values of the keys, missing and stale keys are left out."""
+        oldest = time.time() - self.ttl_s
+        values = {}
+        # Stay below SQLite's limit of host parameters
+        for start in range(0, len(keys), 500):
+            chunk = keys[start : start + 500]
+            rows = self.db.execute(
+                "SELECT key, value FROM responses WHERE namespace = ? AND fetched >= ? "
+                f"AND key IN ({', '.join('?' * len(chunk))})",
+                [namespace, oldest, *chunk],
+            )
+            values.update((key, json.loads(value)) for key, value in rows)
+        return values
+
+    def put_many(self, namespace: str, values: dict) -> None:
+        now = time.time()
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                [(namespace, key, json.dumps(v), now) for key, v in values.items()],
+            )
+
+    def lookup(self, namespace: str, keys: list[str], fetch) -> dict:
+        """
+        Values of all keys, fetching the ones not cached or stale in one call.
+
+        Args:
+            namespace: Kind of response, e.g. "ric_isin"
+            keys: Keys to look up, duplicates are fetched once
+            fetch: Function from a list of keys to a dict of their values, keys
+                without a value are left out and requested again next time
+        """
+        keys = list(dict.fromkeys(keys))
+        values = self.get_many(namespace, keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            fetched = fetch(missing)
+            self.put_many(namespace, fetched)
+            values.update(fetched)
+        return values
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Minimal fake Eikon Data API Proxy for testing the download scripts locally.
+
+Serves the proxy's status and handshake endpoints and the UDF requests used by
+download_rics.py, add_timestamps.py and price_store.py (DataGrid for index
+constituents, their details and exchanges, SymbologySearch for RIC <-> ISIN,
+TimeSeries for daily closes) for a synthetic universe. Closes are a
+deterministic random walk per RIC on weekdays up to today. Point the eikon
+library at it with
+
+    DP_PROXY_BASE_URL=http://127.0.0.1:9100 EIKON_APP_KEY=fake python3 download_rics.py
+
+Every request is counted per entity, GET /stats returns the counts, so the
+number of API calls a script makes can be checked without an Eikon licence.
+"""
+
+import argparse
+import asyncio
+import datetime
+import zlib
+from collections import Counter
+
+import numpy as np
+from aiohttp import web
+
+from add_timestamps import EXCHANGE_BY_SUFFIX, EXCHANGE_FIXES
+
+# Number of constituents of the indices
+INDEX_SIZES = {".STOXX50": 50, ".STOXX": 600}
+
+SECTORS = ["Financials", "Industrials", "Healthcare", "Technology", "Energy"]
+COUNTRIES = {
+    "AS": "Netherlands",
+    "BR": "Belgium",
+    "CO": "Denmark",
+    "DE": "Germany",
+    "HE": "Finland",
+    "L": "United Kingdom",
+    "MC": "Spain",
+    "MI": "Italy",
+    "PA": "France",
+    "S": "Switzerland",
+}
+# Data points per TimeSeries request Eikon allows
+MAX_POINTS = 3000
+# First synthetic close
+SERIES_START = np.datetime64("2023-01-02")
+
+# Eikon reports some exchanges under other codes than the calendars
+EIKON_EXCHANGES = {fixed: code for code, fixed in EXCHANGE_FIXES.items()}
+
+DISPLAY_NAMES = {
+    "TR.INDEXCONSTITUENTRIC": "Constituent RIC",
+    "TR.COMMONNAME": "Company Common Name",
+    "TR.BUSSINESSSUMMARY": "Business Summary Description",
+    "TR.TRBCECONOMICSECTOR": "TRBC Economic Sector Name",
+    "TR.HEADQUARTERSCOUNTRY": "Country of Headquarters",
+    "TR.COMPANYMARKETCAP": "Company Market Cap",
+    "TR.EXCHANGEMARKETIDCODE": "Market MIC",
+}
+
+
+def make_universe() -> dict[str, dict]:
+    """Instrument details by main RIC, constituents of smaller indices come first."""
+    suffixes = sorted(EXCHANGE_BY_SUFFIX)
+    universe = {}
+    for i in range(max(INDEX_SIZES.values())):
+        suffix = suffixes[i % len(suffixes)]
+        stem = f"FK{i:03d}"
+        exchange = EXCHANGE_BY_SUFFIX[suffix]
+        universe[f"{stem}.{suffix}"] = {
+            "ISIN": f"XS{i:010d}",
+            "RICs": [f"{stem}.{suffix}", f"{stem}.F", f"{stem}.TQ"],
+            "TR.COMMONNAME": f"Fake {stem} AG",
+            "TR.BUSSINESSSUMMARY": f"Fake {stem} AG makes synthetic products.",
+            "TR.TRBCECONOMICSECTOR": SECTORS[i % len(SECTORS)],
+            "TR.HEADQUARTERSCOUNTRY": COUNTRIES[suffix],
+            "TR.COMPANYMARKETCAP": round(500_000 / (i + 1), 2),
+            "TR.EXCHANGEMARKETIDCODE": EIKON_EXCHANGES.get(exchange, exchange),
+        }
+    return universe
+
+
+def symbology(universe: dict, request: dict) -> dict:
+    by_isin = {details["ISIN"]: ric for ric, details in universe.items()}
+
+    mapped = []
+    for symbol in request["symbols"]:
+        ric = symbol if request["from"] == "RIC" else by_isin.get(symbol)
+        if ric not in universe:
+            mapped.append(
+                {"symbol": symbol, "bestMatch": {"error": "No best match available"}}
+            )
+            continue
+
+        values = {"RIC": ric, "ISIN": universe[ric]["ISIN"]}
+        lists = {"RICs": universe[ric]["RICs"], "ISINs": [universe[ric]["ISIN"]]}
+        result = {"symbol": symbol}
+        result["bestMatch"] = {to: values[to] for to in request["to"]}
+        if not request["bestMatchOnly"]:
+            result.update({f"{to}s": lists[f"{to}s"] for to in request["to"]})
+        mapped.append(result)
+
+    return {"mappedSymbols": mapped}
+
+
+def data_grid(universe: dict, request: dict) -> dict:
+    fields = [field["name"].upper() for field in request["fields"]]
+
+    rows = []
+    for instrument in request["instruments"]:
+        if fields == ["TR.INDEXCONSTITUENTRIC"]:
+            size = INDEX_SIZES.get(instrument, 0)
+            rows.extend([instrument, ric] for ric in list(universe)[:size])
+        else:
+            details = universe.get(instrument, {})
+            rows.append([instrument] + [details.get(field, "") for field in fields])
+
+    # Only descending sorts are used by the scripts
+    for i, field in enumerate(request["fields"]):
+        if field.get("sort") == "desc":
+            rows.sort(key=lambda row: row[i + 1] or 0, reverse=True)
+
+    headers = [{"displayName": "Instrument"}] + [
+        {"displayName": DISPLAY_NAMES.get(field, field), "field": field}
+        for field in fields
+    ]
+    return {
+        "responses": [
+            {
+                "columnHeadersCount": 1,
+                "headerOrientation": "horizontal",
+                "headers": [headers],
+                "rowHeadersCount": 1,
+                "totalColumnsCount": len(headers),
+                "totalRowsCount": len(rows) + 1,
+                "data": rows,
+            }
+        ]
+    }
+
+
+def closes(ric: str, start: np.datetime64, end: np.datetime64) -> list[list]:
+    """Weekday closes of the RIC between start and end as TIMESTAMP, CLOSE rows."""
+    days = np.arange(SERIES_START, end + 1, dtype="datetime64[D]")
+    days = days[np.is_busday(days)]
+    # Same walk for the RIC in every request
+    rng = np.random.default_rng(zlib.crc32(ric.encode()))
+    walk = 100 * np.exp(np.cumsum(rng.normal(0, 0.015, len(days))))
+
+    keep = days >= start
+    return [
+        [f"{day}T00:00:00Z", round(float(close), 4)]
+        for day, close in zip(days[keep], walk[keep])
+    ]
+
+
+def time_series(universe: dict, request: dict) -> dict:
+    start = np.datetime64(request["startdate"][:10], "D")
+    end = min(
+        np.datetime64(request["enddate"][:10], "D"),
+        np.datetime64(datetime.date.today(), "D"),
+    )
+
+    points = int(np.busday_count(start, end + 1)) * len(request["rics"])
+    if points > MAX_POINTS:
+        return {"ErrorCode": 400, "ErrorMessage": f"{points} data points requested"}
+
+    known_rics = {ric for details in universe.values() for ric in details["RICs"]}
+    series = []
+    for ric in request["rics"]:
+        known = ric in known_rics
+        rows = closes(ric, start, end) if known else []
+        status = {"statusCode": "Normal"}
+        if not rows:
+            reason = "No data available" if known else "Invalid RIC"
+            status = {"statusCode": "Error", "errorMessage": f"Description: {reason}"}
+        series.append(
+            {
+                "ric": ric,
+                **status,
+                "fields": [{"name": "TIMESTAMP"}, {"name": "CLOSE"}],
+                "dataPoints": rows,
+            }
+        )
+    return {"timeseriesData": series}
+
+
+def make_app(latency: float):
+    universe = make_universe()
+    calls = Counter()
+
+    async def status(request: web.Request) -> web.Response:
+        return web.json_response({"statusCode": "ST_PROXY_READY", "version": "fake"})
+
+    async def handshake(request: web.Request) -> web.Response:
+        return web.json_response(
+            {"access_token": "fake", "expires_in": 86400, "token_type": "bearer"}
+        )
+
+    async def data(request: web.Request) -> web.Response:
+        body = await request.json()
+        entity, payload = body["Entity"]["E"], body["Entity"]["W"]
+        calls[entity] += 1
+        await asyncio.sleep(latency)
+
+        if entity == "SymbologySearch":
+            return web.json_response(symbology(universe, payload))
+        if entity.startswith("DataGrid"):
+            return web.json_response(data_grid(universe, payload["requests"][0]))
+        if entity == "TimeSeries":
+            return web.json_response(time_series(universe, payload))
+        return web.json_response(
+            {"ErrorCode": 404, "ErrorMessage": f"Unknown entity {entity}"}
+        )
+
+    async def stats(request: web.Request) -> web.Response:
+        return web.json_response(dict(calls))
+
+    app = web.Application()
+    app.router.add_get("/api/status", status)
+    app.router.add_post("/api/handshake", handshake)
+    app.router.add_post("/api/v1/data", data)
+    app.router.add_get("/stats", stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument(
+        "--latency", type=float, default=0.2, help="Seconds of overhead per request"
+    )
+    args = parser.parse_args()
+
+    web.run_app(make_app(args.latency), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
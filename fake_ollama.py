@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Minimal fake Ollama server for testing benchmark_qwen.py locally.
+
+Implements the non-streaming /api/generate endpoint. Every line of the prompt
+is treated as one headline and answered in the format Qwen3 produces, a
+<think> block followed by a JSON array. The server has a fixed number of slots
+(like OLLAMA_NUM_PARALLEL) and a configurable per-request latency, so
+concurrency and batching effects can be measured without a GPU.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+POSITIVE_WORDS = ("rise", "beat", "wins", "increase", "growth", "upgrade", "record")
+NEGATIVE_WORDS = ("fall", "cut", "probe", "drop", "warn", "loss", "downgrade")
+
+
+def classify(headline: str) -> str:
+    text = headline.lower()
+    if any(word in text for word in NEGATIVE_WORDS):
+        return "Negative"
+    if any(word in text for word in POSITIVE_WORDS):
+        return "Positive"
+    return "Neutral"
+
+
+def make_app(slots: int, latency: float, per_headline: float, failure_rate: float):
+    semaphore = asyncio.Semaphore(slots)
+
+    async def generate(request: web.Request) -> web.Response:
+        body = await request.json()
+        headlines = [h for h in body.get("prompt", "").splitlines() if h.strip()]
+
+        async with semaphore:
+            await asyncio.sleep(latency + per_headline * len(headlines))
+
+            if random.random() < failure_rate:
+                return web.json_response({"error": "fake failure"}, status=500)
+
+        answer = [
+            {"headline": h, "sentiment": classify(h), "confidence": 0.9}
+            for h in headlines
+        ]
+        return web.json_response(
+            {
+                "model": body.get("model", ""),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "response": f"<think>fake reasoning</think>\n{json.dumps(answer)}",
+                "done": True,
+            }
+        )
+
+    app = web.Application()
+    app.router.add_post("/api/generate", generate)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--slots", type=int, default=4)
+    parser.add_argument(
+        "--latency", type=float, default=0.5, help="Seconds of overhead per request"
+    )
+    parser.add_argument(
+        "--per-headline", type=float, default=0.1, help="Extra seconds per headline"
+    )
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    web.run_app(
+        make_app(args.slots, args.latency, args.per_headline, args.failure_rate),
+        host=args.host,
+        port=args.port,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,17 +2,20 @@
 """
 Filter headlines to remove automated/technical news that don't carry sentiment value.
 
-This script processes headline JSON files from data/headlines_preds/ and saves
+This script processes headline files from data/headlines_preds/ and saves
 filtered versions to data/filtered_headlines/, removing administrative and
-automated news that don't provide meaningful sentiment signals.
+automated news that don't provide meaningful sentiment signals. Every file is
+written in the format it was read in (columnar .npz or JSON, see
+headline_store.py).
 """
 
-import json
 import re
 from collections import defaultdict
 from pathlib import Path
 from typing import Dict
 
+from headline_store import headline_files, load_records, save_headlines
+
 
 def is_automated_headline(text: str) -> bool:
     """
@@ -130,13 +133,30 @@ def is_automated_headline(text: str) -> bool:
     return False
 
 
+def is_excluded_headline(headline: dict) -> bool:
+    """
+    Check if a headline record should be dropped, by its text or metadata.
+
+    Args:
+        headline: Headline record as downloaded from Eikon
+
+    Returns:
+        True if the headline should be filtered out, False otherwise
+    """
+    return (
+        is_automated_headline(headline.get("text", ""))
+        or headline.get("documentType", "") == "Filing"
+        or headline.get("sourceName", "") == "Event Transcripts News"
+    )
+
+
 def filter_headlines_file(input_file: Path, output_file: Path) -> Dict[str, int]:
     """
-    Filter headlines from a single JSON file.
+    Filter headlines from a single file.
 
     Args:
-        input_file: Path to input JSON file
-        output_file: Path to output filtered JSON file
+        input_file: Path to input headline file
+        output_file: Path to output filtered headline file
 
     Returns:
         Dictionary with filtering statistics
@@ -144,8 +164,7 @@ def filter_headlines_file(input_file: Path, output_file: Path) -> Dict[str, int]
     stats = {"total": 0, "filtered_out": 0, "kept": 0, "duplicates_removed": 0}
 
     try:
-        with open(input_file, "r", encoding="utf-8") as f:
-            headlines = json.load(f)
+        headlines = load_records(str(input_file))
 
         filtered_headlines = []
         filtered_sentiment = defaultdict(int)
@@ -157,11 +176,7 @@ def filter_headlines_file(input_file: Path, output_file: Path) -> Dict[str, int]
             text_lower = text.lower()
             sentiment = headline.get("label", "").lower()
 
-            if (
-                is_automated_headline(text)
-                or headline.get("documentType", "") == "Filing"
-                or headline.get("sourceName", "") == "Event Transcripts News"
-            ):
+            if is_excluded_headline(headline):
                 stats["filtered_out"] += 1
                 filtered_sentiment[sentiment] += 1
             # Check for consecutive duplicate text (case-insensitive)
@@ -178,8 +193,7 @@ def filter_headlines_file(input_file: Path, output_file: Path) -> Dict[str, int]
         output_file.parent.mkdir(parents=True, exist_ok=True)
 
         # Save filtered headlines
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(filtered_headlines, f, indent=2, ensure_ascii=False)
+        save_headlines(str(output_file), filtered_headlines)
 
         print(f"Filtered sentiment counts: {dict(filtered_sentiment)}")
 
@@ -192,26 +206,34 @@ def filter_headlines_file(input_file: Path, output_file: Path) -> Dict[str, int]
         return stats
 
 
-def main():
-    """Main function to process all headline files."""
+def main(
+    input_dir: Path = Path("data/headlines_preds"),
+    output_dir: Path = Path("data/filtered_headlines"),
+) -> Dict[str, int]:
+    """
+    Process all headline files.
+
+    Args:
+        input_dir: Directory with predicted headline files
+        output_dir: Directory to save the filtered files to
 
-    # Paths
-    input_dir = Path("data/headlines_preds")
-    output_dir = Path("data/filtered_headlines")
+    Returns:
+        Dictionary with overall filtering statistics
+    """
 
     # Check if input directory exists
     if not input_dir.exists():
         print(f"Error: Input directory {input_dir} does not exist")
-        return
+        return {}
 
-    # Get all JSON files
-    json_files = list(input_dir.glob("*.json"))
+    # Get all headline files, columnar where both formats exist
+    headline_paths = [input_dir / file for file in headline_files(str(input_dir))]
 
-    if not json_files:
-        print(f"No JSON files found in {input_dir}")
-        return
+    if not headline_paths:
+        print(f"No headline files found in {input_dir}")
+        return {}
 
-    print(f"Found {len(json_files)} files to process")
+    print(f"Found {len(headline_paths)} files to process")
 
     # Overall statistics
     total_stats = {
@@ -225,7 +247,7 @@ def main():
     }
 
     # Process each file
-    for input_file in sorted(json_files):
+    for input_file in headline_paths:
         print(f"Processing {input_file.name}...")
 
         # Create output filename (keep same name)
@@ -292,6 +314,8 @@ def main():
 
     print(f"\nFiltered files saved to: {output_dir}")
 
+    return total_stats
+
 
 if __name__ == "__main__":
     main()
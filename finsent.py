@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Single command-line entry point for all pipeline stages.
+
+Every subcommand runs the script of its stage as if it was started directly,
+with the remaining arguments passed through, e.g.
+
+    python3 finsent.py predict --dedup
+    python3 finsent.py te --mpi targets --features SENTIMENT VOLUME
+
+Nothing but the standard library is imported until a subcommand runs, and the
+heavy dependencies (transformers, IDTxl, eikon, ...) are only imported by the
+stages that need them. --profile-startup reports the import time of every
+subcommand's script and of the heavy dependencies it loads when it runs.
+"""
+
+import argparse
+import runpy
+import subprocess
+import sys
+import time
+
+# Subcommand -> (script module, heavy dependencies imported when it runs,
+# whether the script parses its own arguments, help)
+COMMANDS = {
+    "rics": (
+        "download_rics",
+        ["eikon"],
+        True,
+        "Step 1: download the index constituents",
+    ),
+    "download": (
+        "download_headlines_prices",
+        ["eikon"],
+        True,
+        "Step 2: download headlines and prices",
+    ),
+    "prices": (
+        "price_store",
+        ["eikon", "pandas_market_calendars"],
+        True,
+        "Incrementally update the daily price store",
+    ),
+    "predict": (
+        "predict",
+        ["transformers"],
+        True,
+        "Step 3: predict headline sentiment with FinBERT",
+    ),
+    "dedup": (
+        "dedup_headlines",
+        [],
+        True,
+        "Cluster near-duplicate headlines",
+    ),
+    "store": (
+        "headline_store",
+        [],
+        True,
+        "Convert headline JSON to columnar files and compare both formats",
+    ),
+    "filter": (
+        "filter_headlines",
+        [],
+        False,
+        "Step 4: filter automated headlines",
+    ),
+    "timestamps": (
+        "add_timestamps",
+        ["pandas_market_calendars", "eikon"],
+        False,
+        "Step 5: add market close timestamps to prices",
+    ),
+    "aggregate": (
+        "aggregate_test",
+        ["statsmodels.tsa.stattools"],
+        True,
+        "Step 6: aggregate sentiment features and test stationarity",
+    ),
+    "aggregate-mf": (
+        "aggregate_multifreq",
+        ["statsmodels.tsa.stattools"],
+        True,
+        "Step 6 at several bar frequencies",
+    ),
+    "te": (
+        "transfer_entropy",
+        ["idtxl.multivariate_te", "matplotlib.pyplot"],
+        True,
+        "Step 7: transfer entropy analysis",
+    ),
+    "te-sweep": (
+        "te_sweep",
+        ["idtxl.multivariate_te"],
+        True,
+        "Step 7 for a grid of settings on a process pool",
+    ),
+    "symbolic": (
+        "symbolic_te",
+        ["scipy.stats"],
+        True,
+        "Ordinal-pattern TE screen of all pairs",
+    ),
+    "pipeline": (
+        "pipeline",
+        [],
+        True,
+        "Incremental runner for steps 2-7",
+    ),
+    "stream": (
+        "stream_sentiment",
+        ["transformers", "pandas_market_calendars"],
+        True,
+        "Streaming headline -> next-close sentiment service",
+    ),
+    "server": (
+        "sentiment_server",
+        ["aiohttp", "transformers"],
+        True,
+        "Warm-model sentiment inference server",
+    ),
+    "stories": (
+        "score_stories",
+        ["transformers"],
+        True,
+        "Sentiment of full stories in overlapping token windows",
+    ),
+}
+
+# Run in a fresh interpreter, prints the cumulative import times
+PROFILE_SCRIPT = """
+import importlib, sys, time
+start = time.perf_counter()
+for name in sys.argv[1:]:
+    try:
+        importlib.import_module(name)
+        print(name, time.perf_counter() - start)
+    except ImportError:
+        print(name, "missing")
+"""
+
+
+def profile_startup(commands: list[str]) -> None:
+    """Import times of the subcommands, each in a fresh interpreter."""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    print(f"Interpreter startup: {time.perf_counter() - start:.2f} s\n")
+
+    print(f"{'command':<14}{'script':>10}{'when run':>10}  heavy dependencies")
+    for command in commands:
+        module, dependencies, _, _ = COMMANDS[command]
+        output = subprocess.run(
+            [sys.executable, "-c", PROFILE_SCRIPT, module, *dependencies],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()
+        times = dict(zip(output[::2], output[1::2]))
+
+        loaded = [float(t) for t in times.values() if t != "missing"]
+        script = times[module]
+        script = script if script == "missing" else f"{float(script):.2f} s"
+        when_run = f"{max(loaded):.2f} s" if loaded else "missing"
+        dependencies = [
+            f"{name} (missing)" if times[name] == "missing" else name
+            for name in dependencies
+        ]
+        print(f"{command:<14}{script:>10}{when_run:>10}  {', '.join(dependencies)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="finsent", description=__doc__.strip().splitlines()[0]
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Report import times of the subcommand (of all without one) and exit",
+    )
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+    for command, (_, _, own_arguments, description) in COMMANDS.items():
+        # Scripts with their own arguments also handle --help themselves
+        subparsers.add_parser(
+            command,
+            help=description,
+            description=description,
+            add_help=not own_arguments,
+        )
+
+    # Unknown arguments are the ones for the script of the subcommand
+    args, script_args = parser.parse_known_args()
+    if script_args and (args.command is None or not COMMANDS[args.command][2]):
+        parser.error(f"unrecognized arguments: {' '.join(script_args)}")
+
+    if args.profile_startup:
+        profile_startup([args.command] if args.command else list(COMMANDS))
+        return
+
+    if args.command is None:
+        parser.print_help()
+        return
+
+    module = COMMANDS[args.command][0]
+    sys.argv = [f"{module}.py", *script_args]
+    runpy.run_module(module, run_name="__main__", alter_sys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Generate synthetic Eikon-like fixtures for the preprocessing pipeline.
+
+Writes raw headlines (data/headlines/), headlines with sentiment predictions
+(data/headlines_preds/) and daily prices (data/prices/) in the formats
+produced by download_headlines_prices.py and predict.py, so that the stages
+predict.py -> filter_headlines.py -> add_timestamps.py -> aggregate_test.py
+can run without Eikon access.
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+SUFFIXES = ["PA", "DE", "L", "AS", "MI", "MC", "S"]
+
+COMPANY_TEMPLATES = [
+    "{company} shares rise after quarterly results beat expectations",
+    "{company} cuts full-year guidance amid weak demand",
+    "{company} to acquire rival in 2.1 billion euro deal",
+    "{company} CEO to step down at end of year",
+    "BUZZ-{company} falls after analyst downgrade",
+    "UPDATE 1-{company} wins regulatory approval for new plant",
+    "{company} announces dividend increase",
+    "{company} faces probe over accounting practices",
+    "Analysts see {company} margins under pressure",
+    "{company} signs long-term supply contract",
+]
+
+# Headlines that filter_headlines.is_automated_headline() drops
+AUTOMATED_TEMPLATES = [
+    "REG-{company}: Transaction in Own Shares",
+    "{company} - Share buyback programme update",
+    "RPT-{company} shares rise after quarterly results beat expectations",
+    "REMIT, {company} unit outage",
+]
+
+LABELS = np.array(["positive", "neutral", "negative"])
+
+
+def generate_fixtures(
+    root: str,
+    n_headlines: int,
+    n_tickers: int = 10,
+    start: str = "2023-10-23",
+    end: str = "2025-06-14",
+    automated_share: float = 0.1,
+    seed: int = 0,
+) -> list[str]:
+    """
+    Write raw headlines, predicted headlines and daily prices under root/data.
+
+    Args:
+        root: Directory to create the data/ layout in
+        n_headlines: Total number of headlines across all tickers
+        n_tickers: Number of tickers
+        start: First date of the fixtures
+        end: Last date of the fixtures
+        automated_share: Share of headlines that the filter should drop
+        seed: Seed of the random generator
+
+    Returns:
+        List of the generated RICs
+    """
+    rng = np.random.default_rng(seed)
+
+    headlines_dir = os.path.join(root, "data", "headlines")
+    preds_dir = os.path.join(root, "data", "headlines_preds")
+    prices_dir = os.path.join(root, "data", "prices")
+    for directory in (headlines_dir, preds_dir, prices_dir):
+        os.makedirs(directory, exist_ok=True)
+
+    start_ts, end_ts = pd.Timestamp(start, tz="UTC"), pd.Timestamp(end, tz="UTC")
+    span_s = int((end_ts - start_ts).total_seconds())
+    trading_days = pd.bdate_range(start, end)
+
+    rics = [f"FIX{i:03d}.{SUFFIXES[i % len(SUFFIXES)]}" for i in range(n_tickers)]
+    counts = rng.multinomial(n_headlines, np.full(n_tickers, 1 / n_tickers))
+
+    for ric, count in zip(rics, counts):
+        company = f"Fixture {ric.split('.')[0][3:]} Corp"
+        file_name = f"{ric.replace('.', '-')}_headlines.json"
+
+        # Eikon returns the newest headlines first
+        offsets = np.sort(rng.integers(0, span_s, size=count))[::-1]
+        created = start_ts + pd.to_timedelta(offsets, unit="s")
+        automated = rng.random(count) < automated_share
+        templates = np.where(
+            automated,
+            rng.integers(len(AUTOMATED_TEMPLATES), size=count),
+            rng.integers(len(COMPANY_TEMPLATES), size=count),
+        )
+        labels = LABELS[rng.integers(len(LABELS), size=count)]
+        scores = rng.uniform(0.5, 1.0, size=count)
+
+        raw, preds = [], []
+        for i in range(count):
+            template_list = AUTOMATED_TEMPLATES if automated[i] else COMPANY_TEMPLATES
+            version_created = created[i].strftime("%Y-%m-%dT%H:%M:%S.000Z")
+            headline = {
+                "firstCreated": version_created,
+                "versionCreated": version_created,
+                "text": template_list[templates[i]].format(company=company),
+                "storyId": f"urn:newsml:fixture:{ric}:{i}",
+                "sourceCode": "NS:RTRS",
+                "sourceName": "Reuters",
+                "documentType": "Story",
+            }
+            raw.append(headline)
+            preds.append({"label": labels[i], "score": float(scores[i]), **headline})
+
+        with open(os.path.join(headlines_dir, file_name), "w", encoding="utf-8") as f:
+            json.dump(raw, f, ensure_ascii=False)
+        with open(os.path.join(preds_dir, file_name), "w", encoding="utf-8") as f:
+            json.dump(preds, f, ensure_ascii=False)
+
+        # Daily closes as downloaded by get_instrument_stock_prices
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, size=len(trading_days))))
+        prices = pd.DataFrame(
+            {"CLOSE": close}, index=pd.Index(trading_days, name="Date")
+        )
+        prices.to_csv(os.path.join(prices_dir, f"{ric.replace('.', '-')}.csv"))
+
+    return rics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--headlines", type=int, default=10_000)
+    parser.add_argument("--tickers", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--root", default=os.path.join("data", "fixtures"))
+    args = parser.parse_args()
+
+    rics = generate_fixtures(args.root, args.headlines, args.tickers, seed=args.seed)
+    print(f"Written {args.headlines:,} headlines for {len(rics)} tickers to {args.root}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Generate a synthetic sentiment/returns panel with planted couplings.
+
+The output mimics the per-ticker CSVs written by aggregate_test.py to
+data/aggregate/ (columns CLOSE, Date, SENTIMENT, LOG_RETURNS), so it can be fed
+to transfer_entropy.prepare_data() without Eikon access. Alongside the CSVs an
+edges.json file lists the planted sentiment -> returns couplings and their lags,
+which serve as ground truth for the benchmarks.
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+EDGES_FILE = "edges.json"
+
+
+def generate_panel(
+    n_tickers: int,
+    n_days: int,
+    n_couplings: int | None = None,
+    max_lag: int = 3,
+    coupling_strength: float = 0.004,
+    headline_rate: float = 1.5,
+    seed: int = 0,
+) -> tuple[dict[str, pd.DataFrame], list[dict]]:
+    """
+    Simulate daily sentiment sums and log returns for a set of tickers.
+
+    Sentiment is the sum of Poisson-many headline labels drawn from {-1, 0, 1},
+    i.e. small integers with plenty of zero days, like the real SENTIMENT column.
+    Each planted coupling adds coupling_strength * sentiment of the source ticker
+    at the given lag to the log returns of the target ticker.
+
+    Args:
+        n_tickers: Number of tickers in the panel
+        n_days: Number of trading days
+        n_couplings: Number of planted edges (defaults to n_tickers // 2, at least 1)
+        max_lag: Planted lags are drawn from 1..max_lag
+        coupling_strength: Return response to one unit of lagged sentiment
+        headline_rate: Mean number of headlines per ticker and day
+        seed: Seed of the random generator
+
+    Returns:
+        Tuple of (ticker -> aggregate DataFrame, list of planted edges)
+    """
+    rng = np.random.default_rng(seed)
+    tickers = [f"SYN{i:03d}" for i in range(n_tickers)]
+
+    if n_couplings is None:
+        n_couplings = max(1, n_tickers // 2)
+
+    # Daily sentiment sums, shape (days, tickers)
+    n_headlines = rng.poisson(headline_rate, size=(n_days, n_tickers))
+    positive = rng.binomial(n_headlines, 0.35)
+    negative = rng.binomial(n_headlines - positive, 0.4)
+    sentiment = positive - negative
+
+    # Plant couplings, each target ticker receives at most one edge
+    targets = rng.choice(n_tickers, size=min(n_couplings, n_tickers), replace=False)
+    edges = []
+    returns = rng.normal(0.0, 0.01, size=(n_days, n_tickers))
+    for target in targets:
+        source = int(rng.integers(n_tickers))
+        lag = int(rng.integers(1, max_lag + 1))
+        returns[lag:, target] += coupling_strength * sentiment[:-lag, source]
+        edges.append(
+            {
+                "source": f"{tickers[source]}_SENTIMENT",
+                "target": f"{tickers[target]}_LOG_RETURNS",
+                "lag": lag,
+            }
+        )
+
+    # Market close timestamps on business days, like the timestamped price files
+    dates = pd.bdate_range("2023-10-24", periods=n_days + 1, tz="UTC") + pd.Timedelta(
+        hours=16, minutes=30
+    )
+
+    frames = {}
+    for i, ticker in enumerate(tickers):
+        log_returns = np.concatenate([[np.nan], returns[:, i]])
+        close = 100 * np.exp(np.nancumsum(log_returns))
+        frames[ticker] = pd.DataFrame(
+            {
+                "CLOSE": close,
+                "Date": dates,
+                "SENTIMENT": np.concatenate([[0], sentiment[:, i]]).astype(int),
+                "LOG_RETURNS": log_returns,
+            }
+        )
+
+    return frames, edges
+
+
+def write_panel(out_dir: str, frames: dict[str, pd.DataFrame], edges: list[dict]):
+    os.makedirs(out_dir, exist_ok=True)
+
+    for ticker, df in frames.items():
+        df.to_csv(os.path.join(out_dir, f"{ticker}.csv"), index=False)
+
+    with open(os.path.join(out_dir, EDGES_FILE), "w") as f:
+        json.dump(edges, f, indent=2)
+
+
+def load_edges(panel_dir: str) -> list[dict]:
+    with open(os.path.join(panel_dir, EDGES_FILE)) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tickers", type=int, default=50)
+    parser.add_argument("--days", type=int, default=417)
+    parser.add_argument("--couplings", type=int, default=None)
+    parser.add_argument("--max-lag", type=int, default=3)
+    parser.add_argument("--strength", type=float, default=0.004)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--out-dir", default=os.path.join("data", "synthetic", "aggregate")
+    )
+    args = parser.parse_args()
+
+    frames, edges = generate_panel(
+        args.tickers,
+        args.days,
+        n_couplings=args.couplings,
+        max_lag=args.max_lag,
+        coupling_strength=args.strength,
+        seed=args.seed,
+    )
+    write_panel(args.out_dir, frames, edges)
+
+    print(f"Written {len(frames)} tickers x {args.days} days to {args.out_dir}")
+    print(f"Planted edges ({len(edges)}):")
+    for edge in edges:
+        print(f"  {edge['source']} -> {edge['target']} (lag {edge['lag']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Compact columnar storage for predicted and filtered headlines.
+
+predict.py used to merge every raw Eikon record into its prediction and write
+indented JSON, and filter_headlines.py rewrote the same records again. Headline
+files are now stored as .npz archives of typed columns, projected to the fields
+the later stages use (SCHEMA): strings as one UTF-8 buffer with offsets, the
+creation time as int64 nanoseconds, labels and sources dictionary-encoded and
+the score as float32. Single columns are loaded without touching the others, so
+the aggregation never decodes the headline texts.
+
+Files ending in .json are still read and written in the old format, which is
+what predict.py --format json produces. Running this script converts existing
+JSON outputs and reports disk footprint and load times against the JSON:
+
+    python3 headline_store.py data/headlines_preds data/filtered_headlines
+    python3 headline_store.py --export-json data/filtered_headlines
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+COLUMNAR_SUFFIX = ".npz"
+
+# Stored fields and their types, everything else in the Eikon records is dropped
+SCHEMA = {
+    "text": "string",
+    "storyId": "string",
+    "versionCreated": "timestamp",
+    "label": "category",
+    "score": "float32",
+    "sourceCode": "category",
+    "sourceName": "category",
+    "documentType": "category",
+}
+
+
+def find_headlines_file(directory: str, ticker: str) -> str:
+    """Columnar headlines of the ticker, or its JSON if there is no columnar file."""
+    path = os.path.join(directory, f"{ticker}_headlines{COLUMNAR_SUFFIX}")
+    if os.path.exists(path):
+        return path
+    return os.path.join(directory, f"{ticker}_headlines.json")
+
+
+def headline_files(directory: str) -> list[str]:
+    """Headline files in the directory, the columnar one where both formats exist."""
+    files = {}
+    for file in sorted(os.listdir(directory)):
+        stem, suffix = os.path.splitext(file)
+        if suffix == COLUMNAR_SUFFIX or (suffix == ".json" and stem not in files):
+            files[stem] = file
+    return sorted(files.values())
+
+
+def encode_column(name: str, values, kind: str) -> dict[str, np.ndarray]:
+    if kind == "string":
+        values = ["" if v is None else str(v) for v in values]
+        offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        # Offsets in characters, the buffer is decoded once when loading
+        np.cumsum([len(v) for v in values], out=offsets[1:])
+        buffer = np.frombuffer("".join(values).encode("utf-8"), dtype=np.uint8)
+        return {f"{name}.offsets": offsets, f"{name}.utf8": buffer}
+
+    if kind == "timestamp":
+        times = pd.to_datetime(
+            pd.Series(values, dtype=object), utc=True, format="ISO8601"
+        )
+        return {name: times.dt.tz_convert(None).to_numpy("datetime64[ns]")}
+
+    if kind == "category":
+        categorical = pd.Categorical(pd.Series(values, dtype=object))
+        return {
+            f"{name}.codes": categorical.codes.astype(np.int16),
+            f"{name}.categories": np.array(categorical.categories, dtype=str),
+        }
+
+    return {name: pd.Series(values, dtype="float64").to_numpy(kind)}
+
+
+def decode_column(data, name: str, kind: str):
+    if kind == "string":
+        offsets = data[f"{name}.offsets"]
+        text = data[f"{name}.utf8"].tobytes().decode("utf-8")
+        return pd.Series(
+            [text[start:end] for start, end in zip(offsets[:-1], offsets[1:])],
+            dtype=object,
+        )
+
+    if kind == "timestamp":
+        return pd.Series(data[name]).dt.tz_localize("UTC")
+
+    if kind == "category":
+        return pd.Series(
+            pd.Categorical.from_codes(
+                data[f"{name}.codes"], categories=data[f"{name}.categories"]
+            )
+        )
+
+    return pd.Series(data[name])
+
+
+def write_columns(path: str, records: list[dict]) -> None:
+    arrays = {}
+    for name, kind in SCHEMA.items():
+        arrays.update(encode_column(name, [r.get(name) for r in records], kind))
+    np.savez_compressed(path, **arrays)
+
+
+def read_headlines(path: str, columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    Headlines of a file in either format as a DataFrame, versionCreated as UTC
+    timestamps.
+
+    Args:
+        path: Columnar .npz or JSON headline file
+        columns: Columns to load, all of SCHEMA if None
+    """
+    columns = list(SCHEMA) if columns is None else columns
+
+    if not path.endswith(COLUMNAR_SUFFIX):
+        df = pd.read_json(path, convert_dates=False)
+        df = df[[c for c in columns if c in df.columns]]
+        if "versionCreated" in df.columns:
+            df["versionCreated"] = pd.to_datetime(
+                df["versionCreated"], utc=True, format="ISO8601"
+            )
+        return df
+
+    # Members of the archive are only read when accessed
+    with np.load(path, allow_pickle=False) as data:
+        return pd.DataFrame(
+            {name: decode_column(data, name, SCHEMA[name]) for name in columns}
+        )
+
+
+def load_records(path: str) -> list[dict]:
+    """Headlines of a file in either format as a list of records."""
+    if not path.endswith(COLUMNAR_SUFFIX):
+        with open(path, mode="r", encoding="utf-8") as f:
+            return json.load(f)
+
+    df = read_headlines(path)
+    # Same timestamp format as Eikon
+    df["versionCreated"] = df["versionCreated"].dt.strftime("%Y-%m-%dT%H:%M:%S.%f")
+    df["versionCreated"] = df["versionCreated"].str[:-3] + "Z"
+    df = df.astype(object).where(df.notna(), None)
+    return df.to_dict("records")
+
+
+def save_headlines(path: str, records: list[dict]) -> None:
+    """Write the records as columns, or as indented JSON if path ends in .json."""
+    if path.endswith(".json"):
+        with open(path, mode="w", encoding="utf-8") as f:
+            json.dump(records, f, indent=2, ensure_ascii=False)
+    else:
+        write_columns(path, records)
+
+
+def timed(load, repeat: int = 3) -> float:
+    """Best of repeat load times in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        load()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def convert_folder(folder: str, remove_json: bool = False) -> pd.DataFrame:
+    """Convert the JSON headline files to columns and compare both formats."""
+    rows = []
+    for file in sorted(os.listdir(folder)):
+        if not file.endswith(".json"):
+            continue
+
+        json_path = os.path.join(folder, file)
+        columnar_path = json_path[: -len(".json")] + COLUMNAR_SUFFIX
+        save_headlines(columnar_path, load_records(json_path))
+
+        rows.append(
+            {
+                "file": file,
+                "json_mb": os.path.getsize(json_path) / 1024**2,
+                "columnar_mb": os.path.getsize(columnar_path) / 1024**2,
+                "json_load_s": timed(lambda: pd.read_json(json_path)),
+                "columnar_load_s": timed(lambda: read_headlines(columnar_path)),
+                # What the aggregation reads
+                "columnar_projected_load_s": timed(
+                    lambda: read_headlines(
+                        columnar_path, ["versionCreated", "label", "score"]
+                    )
+                ),
+            }
+        )
+        if remove_json:
+            os.remove(json_path)
+
+    return pd.DataFrame(rows)
+
+
+def export_folder(folder: str) -> int:
+    files = [f for f in sorted(os.listdir(folder)) if f.endswith(COLUMNAR_SUFFIX)]
+    for file in files:
+        path = os.path.join(folder, file)
+        save_headlines(path[: -len(COLUMNAR_SUFFIX)] + ".json", load_records(path))
+    return len(files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "folders",
+        nargs="*",
+        default=[
+            os.path.join("data", "headlines_preds"),
+            os.path.join("data", "filtered_headlines"),
+        ],
+    )
+    parser.add_argument(
+        "--remove-json", action="store_true", help="Delete the converted JSON files"
+    )
+    parser.add_argument(
+        "--export-json",
+        action="store_true",
+        help="Write JSON next to the columnar files instead of converting",
+    )
+    args = parser.parse_args()
+
+    for folder in args.folders:
+        if args.export_json:
+            print(f"{folder}: exported {export_folder(folder)} files to JSON")
+            continue
+
+        report = convert_folder(folder, args.remove_json)
+        if report.empty:
+            print(f"{folder}: no JSON files")
+            continue
+
+        totals = report.drop(columns="file").sum()
+        print(f"\n{folder} ({len(report)} files)")
+        print(
+            f"  Disk:  JSON {totals['json_mb']:.1f} MB -> columnar "
+            f"{totals['columnar_mb']:.1f} MB "
+            f"({totals['json_mb'] / totals['columnar_mb']:.1f}x smaller)"
+        )
+        print(
+            f"  Load:  JSON {totals['json_load_s']:.2f} s -> columnar "
+            f"{totals['columnar_load_s']:.2f} s, without texts "
+            f"{totals['columnar_projected_load_s']:.2f} s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+"""
+Incremental runner for the whole pipeline.
+
+The stages of the README's "Pipeline Execution Order" are declared below with
+their per-ticker inputs and outputs. Every input is fingerprinted by its content
+hash (together with the source of the stage's script) and a stage is only rerun
+for the tickers whose fingerprint changed since the last successful run, which
+is recorded in data/.pipeline_state.json. Independent tickers are processed in
+parallel, the final panel / transfer entropy step runs once all tickers are
+up to date.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Callable
+
+DATA_DIR = "data"
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_PATH = os.path.join(DATA_DIR, ".pipeline_state.json")
+TE_RESULTS_PATH = os.path.join(DATA_DIR, "te_results.pkl")
+
+HASH_CHUNK_SIZE = 1 << 20
+
+
+@dataclass
+class Stage:
+    name: str
+    inputs: Callable[[str], list[str]]
+    outputs: Callable[[str], list[str]]
+    run: Callable[[str], None]
+    depends_on: list[str] = field(default_factory=list)
+    code: list[str] = field(default_factory=list)
+    per_ticker: bool = True
+
+
+def headlines_file(ticker: str) -> str:
+    return os.path.join(DATA_DIR, "headlines", f"{ticker}_headlines.json")
+
+
+def preds_file(ticker: str) -> str:
+    return os.path.join(DATA_DIR, "headlines_preds", f"{ticker}_headlines.npz")
+
+
+def filtered_file(ticker: str) -> str:
+    return os.path.join(DATA_DIR, "filtered_headlines", f"{ticker}_headlines.npz")
+
+
+def prices_file(ticker: str) -> str:
+    return os.path.join(DATA_DIR, "prices", f"{ticker}.csv")
+
+
+def aggregate_file(ticker: str) -> str:
+    return os.path.join(DATA_DIR, "aggregate", f"{ticker}.csv")
+
+
+def path_ticker(path: str) -> str:
+    """Ticker of a per-ticker file, e.g. ABBN-S of ABBN-S_headlines.npz."""
+    return os.path.basename(path).split("_")[0].split(".")[0]
+
+
+def aggregate_files(_=None) -> list[str]:
+    directory = os.path.join(DATA_DIR, "aggregate")
+    if not os.path.exists(directory):
+        return []
+    return sorted(
+        os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".csv")
+    )
+
+
+# Stage implementations, imported lazily so that workers only load what they run
+_nlp = None
+
+
+def run_download(ticker: str) -> None:
+    import eikon as ek
+    import pandas as pd
+    from dotenv import load_dotenv
+
+    from download_headlines_prices import download_instrument
+
+    load_dotenv()
+    ek.set_app_key(os.getenv("EIKON_APP_KEY"))
+
+    constituents = pd.read_csv(os.path.join(DATA_DIR, "constituents.csv"))
+    ric = ticker.replace("-", ".")
+    row = constituents[constituents["Instrument"] == ric].iloc[0]
+    download_instrument(ric, row["All RICs"].split(";"))
+
+
+def run_predict(ticker: str) -> None:
+    global _nlp
+    from predict import load_nlp, predict_file
+
+    # Load the model once per worker process, or connect to the sentiment
+    # server given by $SENTIMENT_SERVER so that all workers share one model
+    if _nlp is None:
+        _nlp = load_nlp()
+
+    os.makedirs(os.path.dirname(preds_file(ticker)), exist_ok=True)
+    predict_file(_nlp, headlines_file(ticker), preds_file(ticker))
+
+
+def run_filter(ticker: str) -> None:
+    from pathlib import Path
+
+    from filter_headlines import filter_headlines_file
+
+    # filter_headlines_file only reports errors, a stale output would look current
+    if os.path.exists(filtered_file(ticker)):
+        os.remove(filtered_file(ticker))
+    filter_headlines_file(Path(preds_file(ticker)), Path(filtered_file(ticker)))
+
+
+def run_timestamps(ticker: str) -> None:
+    from add_timestamps import add_timestamps_file, exchange_from_suffix, get_exchange
+
+    ric = ticker.replace("-", ".")
+    if os.getenv("PIPELINE_OFFLINE_EXCHANGES"):
+        exchange = exchange_from_suffix(ric)
+    else:
+        import eikon as ek
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        ek.set_app_key(os.getenv("EIKON_APP_KEY"))
+        exchange = get_exchange(ric)
+
+    add_timestamps_file(prices_file(ticker), exchange)
+
+
+def run_aggregate(ticker: str) -> None:
+    from aggregate_test import aggregate_ticker
+
+    os.makedirs(os.path.dirname(aggregate_file(ticker)), exist_ok=True)
+    aggregate_ticker(prices_file(ticker), filtered_file(ticker), aggregate_file(ticker))
+
+
+def run_transfer_entropy(_=None) -> None:
+    from transfer_entropy import prepare_data, report_results, run_analysis
+
+    df = prepare_data(os.path.join(DATA_DIR, "aggregate"))
+    results = run_analysis(df)
+
+    with open(TE_RESULTS_PATH, "wb") as f:
+        pickle.dump(results, f)
+
+    report_results(results)
+
+
+STAGES = [
+    Stage(
+        "download",
+        inputs=lambda t: [os.path.join(DATA_DIR, "constituents.csv")],
+        outputs=lambda t: [headlines_file(t), prices_file(t)],
+        run=run_download,
+        code=[
+            os.path.join(CODE_DIR, "download_headlines_prices.py"),
+            os.path.join(CODE_DIR, "price_store.py"),
+        ],
+    ),
+    Stage(
+        "predict",
+        inputs=lambda t: [headlines_file(t)],
+        outputs=lambda t: [preds_file(t)],
+        run=run_predict,
+        depends_on=["download"],
+        code=[os.path.join(CODE_DIR, "predict.py")],
+    ),
+    Stage(
+        "filter",
+        inputs=lambda t: [preds_file(t)],
+        outputs=lambda t: [filtered_file(t)],
+        run=run_filter,
+        depends_on=["predict"],
+        code=[os.path.join(CODE_DIR, "filter_headlines.py")],
+    ),
+    Stage(
+        "timestamps",
+        # Rewrites the prices in place, which is fine as the stage is idempotent
+        inputs=lambda t: [prices_file(t)],
+        outputs=lambda t: [prices_file(t)],
+        run=run_timestamps,
+        depends_on=["download"],
+        code=[os.path.join(CODE_DIR, "add_timestamps.py")],
+    ),
+    Stage(
+        "aggregate",
+        inputs=lambda t: [prices_file(t), filtered_file(t)],
+        outputs=lambda t: [aggregate_file(t)],
+        run=run_aggregate,
+        depends_on=["filter", "timestamps"],
+        code=[os.path.join(CODE_DIR, "aggregate_test.py")],
+    ),
+    Stage(
+        "transfer_entropy",
+        inputs=aggregate_files,
+        outputs=lambda t: [TE_RESULTS_PATH],
+        run=run_transfer_entropy,
+        depends_on=["aggregate"],
+        code=[os.path.join(CODE_DIR, "transfer_entropy.py")],
+        per_ticker=False,
+    ),
+]
+
+STAGES_BY_NAME = {stage.name: stage for stage in STAGES}
+
+
+def topological_order(stages: list[Stage]) -> list[Stage]:
+    order, done = [], set()
+
+    def visit(stage: Stage, path: tuple[str, ...] = ()):
+        if stage.name in done:
+            return
+        if stage.name in path:
+            raise ValueError(f"Cycle in the stage graph: {' -> '.join(path)}")
+        for dependency in stage.depends_on:
+            visit(STAGES_BY_NAME[dependency], path + (stage.name,))
+        done.add(stage.name)
+        order.append(stage)
+
+    for stage in stages:
+        visit(stage)
+    return order
+
+
+def file_hash(path: str, cache: dict) -> str | None:
+    """
+    Content hash of a file, None if it doesn't exist.
+
+    Hashes are cached by (size, mtime) so that unchanged files aren't reread.
+    """
+    if not os.path.exists(path):
+        return None
+
+    stat = os.stat(path)
+    cached = cache.get(path)
+    if cached and cached["size"] == stat.st_size and cached["mtime"] == stat.st_mtime_ns:
+        return cached["hash"]
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+
+    cache[path] = {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "hash": digest.hexdigest(),
+    }
+    return cache[path]["hash"]
+
+
+def fingerprint(paths: list[str], cache: dict) -> dict:
+    return {path: file_hash(path, cache) for path in paths}
+
+
+def stage_fingerprint(stage: Stage, partition: str, cache: dict) -> dict:
+    return {
+        "inputs": fingerprint(stage.inputs(partition), cache),
+        "code": fingerprint(stage.code, cache),
+    }
+
+
+def is_stale(stage: Stage, partition: str, record: dict | None, cache: dict) -> bool:
+    if record is None:
+        return True
+
+    if stage_fingerprint(stage, partition, cache) != record["fingerprint"]:
+        return True
+
+    # Outputs deleted or modified outside of the pipeline
+    outputs = fingerprint(stage.outputs(partition), cache)
+    return outputs != record["outputs"]
+
+
+def run_partition(
+    partition: str,
+    stage_names: list[str],
+    records: dict,
+    cache: dict,
+    forced: list[str],
+    dry_run: bool,
+    upstream_ran: set[str] = frozenset(),
+) -> tuple[str, dict, dict, list[str]]:
+    """
+    Bring all given stages of one partition up to date, in order.
+
+    Args:
+        partition: Ticker, or "panel" for the whole-panel stages
+        stage_names: Stages to check, in topological order
+        records: Records of the last successful runs of this partition
+        cache: File hash cache
+        forced: Stages to run regardless of their fingerprints
+        dry_run: Only report the stages that would run
+        upstream_ran: Stages that ran in other partitions this run feeds on
+
+    Returns:
+        Tuple of (partition, updated stage records, hash cache, stages run)
+    """
+    ran = []
+
+    for name in stage_names:
+        stage = STAGES_BY_NAME[name]
+        record = records.get(name)
+
+        # Without running, upstream changes aren't visible in the fingerprints yet
+        upstream_changed = dry_run and any(
+            dependency in ran or dependency in upstream_ran
+            for dependency in stage.depends_on
+        )
+
+        if (
+            name not in forced
+            and not upstream_changed
+            and not is_stale(stage, partition, record, cache)
+        ):
+            continue
+
+        ran.append(name)
+        if dry_run:
+            continue
+
+        print(f"[{partition}] Running {name}...")
+        try:
+            stage.run(partition)
+            missing = [p for p in stage.outputs(partition) if not os.path.exists(p)]
+            if missing:
+                raise RuntimeError(f"No output written to {', '.join(missing)}")
+
+        except Exception as e:
+            # Downstream stages would only fail on the missing outputs
+            print(f"[{partition}] Error in {name}: {e}")
+            ran[-1] = f"{name} (failed)"
+            records.pop(name, None)
+            break
+
+        records[name] = {
+            "fingerprint": stage_fingerprint(stage, partition, cache),
+            "outputs": fingerprint(stage.outputs(partition), cache),
+        }
+
+    return partition, records, cache, ran
+
+
+def load_state() -> dict:
+    if not os.path.exists(STATE_PATH):
+        return {"records": {}, "hashes": {}}
+
+    with open(STATE_PATH) as f:
+        return json.load(f)
+
+
+def save_state(state: dict) -> None:
+    tmp_path = f"{STATE_PATH}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp_path, STATE_PATH)
+
+
+def list_tickers() -> list[str]:
+    directory = os.path.join(DATA_DIR, "headlines")
+    if not os.path.exists(directory):
+        return []
+
+    return sorted(
+        f.split("_")[0] for f in os.listdir(directory) if f.endswith("_headlines.json")
+    )
+
+
+def run_pipeline(
+    tickers: list[str],
+    stage_names: list[str],
+    jobs: int,
+    forced: list[str],
+    dry_run: bool,
+) -> dict[str, list[str]]:
+    state = load_state()
+    order = [s for s in topological_order(STAGES) if s.name in stage_names]
+    ticker_stages = [s.name for s in order if s.per_ticker]
+    global_stages = [s for s in order if not s.per_ticker]
+
+    ran = {}
+
+    # Per-ticker stages, tickers are independent of each other
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(
+                run_partition,
+                ticker,
+                ticker_stages,
+                state["records"].get(ticker, {}),
+                # Hand each worker only the hashes it may need
+                {
+                    p: h
+                    for p, h in state["hashes"].items()
+                    if path_ticker(p) == ticker
+                },
+                forced,
+                dry_run,
+            )
+            for ticker in tickers
+        ]
+
+        for future in as_completed(futures):
+            ticker, records, cache, ticker_ran = future.result()
+            state["records"][ticker] = records
+            state["hashes"].update(cache)
+            if ticker_ran:
+                ran[ticker] = ticker_ran
+            if not dry_run:
+                save_state(state)
+
+    # Whole-panel stages
+    ticker_ran = {name for names in ran.values() for name in names}
+    for stage in global_stages:
+        _, records, cache, global_ran = run_partition(
+            "panel",
+            [stage.name],
+            state["records"].get("panel", {}),
+            state["hashes"],
+            forced,
+            dry_run,
+            ticker_ran,
+        )
+        state["records"]["panel"] = records
+        state["hashes"].update(cache)
+        if global_ran:
+            ran.setdefault("panel", []).extend(global_ran)
+        if not dry_run:
+            save_state(state)
+
+    return ran
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--tickers", nargs="+", help="Tickers to update, e.g. ABBN-S (default: all)"
+    )
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        choices=[s.name for s in STAGES],
+        default=[s.name for s in STAGES if s.name != "download"],
+        help="Stages to bring up to date (download is opt-in as it hits Eikon)",
+    )
+    parser.add_argument(
+        "--force",
+        nargs="+",
+        choices=[s.name for s in STAGES],
+        default=[],
+        help="Stages to rerun even if fresh",
+    )
+    parser.add_argument("--jobs", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--offline-exchanges",
+        action="store_true",
+        help="Derive exchanges from the RIC suffix instead of asking Eikon",
+    )
+    parser.add_argument(
+        "--server",
+        help="Predict on a running sentiment_server.py instead of loading the "
+        "model in every worker",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only print what would run"
+    )
+    args = parser.parse_args()
+
+    # New data can't be detected by hashing, so downloads always run when asked for
+    forced = args.force + ["download"] if "download" in args.stages else args.force
+
+    if args.offline_exchanges:
+        # Read by the worker processes
+        os.environ["PIPELINE_OFFLINE_EXCHANGES"] = "1"
+    if args.server:
+        os.environ["SENTIMENT_SERVER"] = args.server
+
+    tickers = args.tickers or list_tickers()
+    if not tickers:
+        print(f"No headlines found in {os.path.join(DATA_DIR, 'headlines')}")
+        return
+
+    ran = run_pipeline(tickers, args.stages, args.jobs, forced, args.dry_run)
+
+    print("\nStages that would run:" if args.dry_run else "\nStages run:")
+    if not ran:
+        print("  Nothing, everything is up to date")
+    for partition, stages in sorted(ran.items()):
+        print(f"  {partition}: {', '.join(stages)}")
+
+
+if __name__ == "__main__":
+    main()
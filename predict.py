@@ -1,37 +1,237 @@
+import argparse
+import http.client
 import json
 import os
+import socket
 
-from transformers import pipeline
+from dedup_headlines import INDEX_PATH, NearDuplicateIndex, build_index, print_stats
+from headline_store import COLUMNAR_SUFFIX, save_headlines
 
-if __name__ == "__main__":
-    model_path = "ProsusAI/finbert"
-    nlp = pipeline("sentiment-analysis", model=model_path, tokenizer=model_path)
+MODEL_PATH = "ProsusAI/finbert"
+# Representatives sent to the model at once in the deduplicated mode
+DEDUP_BATCH_SIZE = 10_000
 
-    out_folder = os.path.join("data", "headlines_preds")
-    os.makedirs(out_folder, exist_ok=True)
 
-    in_folder = os.path.join("data", "headlines")
+def load_pipeline(model_path: str = MODEL_PATH):
+    # Imported here, transformers and torch take seconds to import
+    from transformers import pipeline
+
+    return pipeline("sentiment-analysis", model=model_path, tokenizer=model_path)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class SentimentClient:
+    """
+    Drop-in for the transformers pipeline that predicts on a running
+    sentiment_server.py, e.g. at http://127.0.0.1:8765 or unix:/tmp/finsent.sock.
+    """
+
+    def __init__(
+        self,
+        address: str,
+        model_path: str = MODEL_PATH,
+        timeout: float = 600,
+        chunk_size: int = 1024,
+    ):
+        self.model_path = model_path
+        self.chunk_size = chunk_size
+        if address.startswith("unix:"):
+            self.connection = UnixHTTPConnection(address[len("unix:") :], timeout)
+        else:
+            host = address.removeprefix("http://").rstrip("/")
+            self.connection = http.client.HTTPConnection(host, timeout=timeout)
+
+    def post(self, body: str) -> tuple[http.client.HTTPResponse, bytes]:
+        self.connection.request(
+            "POST", "/predict", body, {"Content-Type": "application/json"}
+        )
+        response = self.connection.getresponse()
+        return response, response.read()
+
+    def predict(self, texts: list[str]) -> list[dict]:
+        body = json.dumps({"model": self.model_path, "texts": texts})
+        try:
+            response, content = self.post(body)
+        except ConnectionError:
+            # The server closes idle keep-alive connections, reconnect once
+            self.connection.close()
+            response, content = self.post(body)
+
+        if response.status != 200:
+            # Plain-text errors of aiohttp or a proxy are not JSON
+            try:
+                error = json.loads(content).get("error", response.reason)
+            except (ValueError, AttributeError):
+                error = response.reason
+            raise RuntimeError(f"Sentiment server: {response.status} {error}")
+        return json.loads(content)["results"]
+
+    def __call__(self, texts, **kwargs) -> list[dict]:
+        # Batching is up to the server, so batch_size and the like are ignored
+        if isinstance(texts, str):
+            return self.predict([texts])
+
+        results = []
+        # Chunks keep single requests small and let other clients in between
+        for start in range(0, len(texts), self.chunk_size):
+            results.extend(self.predict(texts[start : start + self.chunk_size]))
+        return results
+
+
+def load_nlp(model_path: str = MODEL_PATH, server: str | None = None):
+    """Client of the sentiment server if one is given, the model itself otherwise."""
+    server = server or os.getenv("SENTIMENT_SERVER")
+    if server:
+        return SentimentClient(server, model_path)
+    return load_pipeline(model_path)
+
+
+def predict_file(nlp, in_path: str, out_path: str) -> int:
+    with open(in_path, mode="r") as f:
+        data = json.load(f)
+
+    headlines = [sample["text"] for sample in data]
+
+    print(f"\tNumber of headlines: {len(headlines)}")
+
+    results = nlp(headlines)
+
+    for original, result in zip(data, results):
+        result.update(original)
 
+    # Columnar unless out_path ends in .json
+    save_headlines(out_path, results)
+
+    return len(headlines)
+
+
+def output_name(file: str, out_format: str) -> str:
+    if out_format == "json":
+        return file
+    return file[: -len(".json")] + COLUMNAR_SUFFIX
+
+
+def predict_folder(
+    in_folder: str = os.path.join("data", "headlines"),
+    out_folder: str = os.path.join("data", "headlines_preds"),
+    nlp=None,
+    out_format: str = "npz",
+) -> int:
+    if nlp is None:
+        nlp = load_pipeline()
+
+    os.makedirs(out_folder, exist_ok=True)
+
+    total = 0
     for file in os.listdir(in_folder):
         if not file.endswith(".json"):
             continue
 
         print(f"Processing {file}")
 
+        out_path = os.path.join(out_folder, output_name(file, out_format))
+        total += predict_file(nlp, os.path.join(in_folder, file), out_path)
+
+        print(f"\tProcessed {file}")
+        print(f"\tPredictions saved to {out_path}")
+
+    return total
+
+
+def predict_folder_dedup(
+    in_folder: str = os.path.join("data", "headlines"),
+    out_folder: str = os.path.join("data", "headlines_preds"),
+    nlp=None,
+    index_path: str = INDEX_PATH,
+    threshold: float = 0.8,
+    out_format: str = "npz",
+    model_path: str = MODEL_PATH,
+) -> dict:
+    """
+    Predict one representative per cluster of near-duplicate headlines across
+    all files and fan its label out to the other members of the cluster.
+    """
+    if nlp is None:
+        nlp = load_pipeline()
+
+    os.makedirs(out_folder, exist_ok=True)
+
+    print("Clustering near-duplicate headlines")
+    index = NearDuplicateIndex(index_path, threshold=threshold)
+    index.use_model(model_path)
+    files = build_index(in_folder, index)
+
+    stats = index.stats()
+    print_stats(stats)
+
+    # Only representatives without a label (e.g. from a persisted index) are run
+    for ids, texts in index.unlabelled(DEDUP_BATCH_SIZE):
+        print(f"\tPredicting {len(texts)} representatives")
+        index.set_labels(ids, nlp(texts))
+
+    for file in files:
         with open(os.path.join(in_folder, file), mode="r") as f:
             data = json.load(f)
 
-        headlines = [sample["text"] for sample in data]
+        results = [
+            {"label": label, "score": score, **original}
+            for original, (label, score) in zip(data, index.member_labels(file))
+        ]
 
-        print(f"\tNumber of headlines: {len(headlines)}")
+        out_path = os.path.join(out_folder, output_name(file, out_format))
+        save_headlines(out_path, results)
 
-        results = nlp(headlines)
+        print(f"\tPredictions saved to {out_path}")
 
-        for original, result in zip(data, results):
-            result.update(original)
+    return stats
 
-        with open(os.path.join(out_folder, file), mode="w") as f:
-            json.dump(results, f, indent=2)
 
-        print(f"\tProcessed {file}")
-        print(f"\tPredictions saved to {os.path.join(out_folder, file)}")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Predict headline sentiment")
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="Only predict one headline per cluster of near-duplicates",
+    )
+    parser.add_argument(
+        "--index-path",
+        default=INDEX_PATH,
+        help="SQLite file for the near-duplicate index, reused across runs "
+        '(":memory:" to not keep it)',
+    )
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument(
+        "--format",
+        choices=["npz", "json"],
+        default="npz",
+        help="Columnar predictions (see headline_store.py) or the old indented JSON",
+    )
+    parser.add_argument(
+        "--server",
+        help="Predict on a running sentiment_server.py, e.g. http://127.0.0.1:8765 "
+        "or unix:/tmp/finsent.sock (default: $SENTIMENT_SERVER)",
+    )
+    args = parser.parse_args()
+
+    nlp = load_nlp(args.model, args.server)
+    if args.dedup:
+        predict_folder_dedup(
+            nlp=nlp,
+            index_path=args.index_path,
+            threshold=args.threshold,
+            out_format=args.format,
+            model_path=args.model,
+        )
+    else:
+        predict_folder(nlp=nlp, out_format=args.format)
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Incremental store of daily closes with their exchange close timestamps.
+
+get_instrument_stock_prices fetched the full history of one RIC per request,
+every run overwrote data/prices/ and add_timestamps.py then rewrote the same
+files. The store keeps one append-only file of typed bars per RIC in
+data/price_store/ (date, exchange close timestamp, close as fixed-size binary
+records). An update only requests the days after each RIC's last stored bar,
+with RICs sharing a start date combined into one get_timeseries request as long
+as the request stays within Eikon's data point limit. A daily refresh of the
+whole universe is a few small requests. The close timestamps are attached from
+the exchange calendars when storing, and data/prices/ is exported from the store
+in the format add_timestamps.py produces.
+
+Closes are adjusted for corporate actions when fetched; after a split, rebuild
+the affected RICs with --full.
+"""
+
+import argparse
+import datetime
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from add_timestamps import exchange_from_suffix, get_exchanges, get_market_closes
+
+STORE_DIR = os.path.join("data", "price_store")
+# Date of our first headlines
+HISTORY_START = datetime.date(2023, 10, 23)
+
+# Eikon returns at most this many data points per get_timeseries request
+MAX_POINTS = 3000
+
+BAR_DTYPE = np.dtype(
+    [("date", "datetime64[D]"), ("close_time", "datetime64[ns]"), ("close", "float64")]
+)
+
+
+def bars_file(store_dir: str, ric: str) -> str:
+    return os.path.join(store_dir, f"{ric.replace('.', '-')}.bars")
+
+
+def read_bars(path: str) -> np.ndarray:
+    if not os.path.exists(path):
+        return np.empty(0, dtype=BAR_DTYPE)
+    # An interrupted append may have left a partial record at the end
+    count = os.path.getsize(path) // BAR_DTYPE.itemsize
+    return np.fromfile(path, dtype=BAR_DTYPE, count=count)
+
+
+def last_date(path: str) -> datetime.date | None:
+    """Date of the last stored bar, read without loading the others."""
+    count = os.path.getsize(path) // BAR_DTYPE.itemsize if os.path.exists(path) else 0
+    if count == 0:
+        return None
+    last = np.fromfile(
+        path, dtype=BAR_DTYPE, count=1, offset=(count - 1) * BAR_DTYPE.itemsize
+    )
+    return last["date"][0].astype(datetime.date)
+
+
+def append_bars(path: str, bars: np.ndarray) -> None:
+    count = os.path.getsize(path) // BAR_DTYPE.itemsize if os.path.exists(path) else 0
+    with open(path, mode="ab") as f:
+        # Drop a partial record before appending
+        f.truncate(count * BAR_DTYPE.itemsize)
+        bars.astype(BAR_DTYPE).tofile(f)
+
+
+def plan_requests(
+    starts: dict[str, datetime.date], end: datetime.date, max_points: int = MAX_POINTS
+) -> list[tuple[datetime.date, list[str]]]:
+    """Requests as (start date, RICs), RICs with the same start share requests."""
+    by_start = {}
+    for ric, start in starts.items():
+        if start <= end:
+            by_start.setdefault(start, []).append(ric)
+
+    requests = []
+    for start, rics in sorted(by_start.items()):
+        days = max(int(np.busday_count(start, end + datetime.timedelta(days=1))), 1)
+        per_request = max(max_points // days, 1)
+        for i in range(0, len(rics), per_request):
+            requests.append((start, rics[i : i + per_request]))
+    return requests
+
+
+def fetch_closes(
+    rics: list[str], start: datetime.date, end: datetime.date, max_retries: int = 10
+) -> pd.DataFrame:
+    """Daily closes of the RICs as rows of RIC, date and close."""
+    import eikon as ek
+
+    retries = 0
+    while retries < max_retries:
+        try:
+            res = ek.get_timeseries(
+                rics=rics,
+                start_date=datetime.datetime.combine(start, datetime.time()),
+                end_date=datetime.datetime.combine(end, datetime.time(23, 59, 59)),
+                interval="daily",
+                fields=["TIMESTAMP", "CLOSE"],
+                calendar="tradingdays",
+                corax="adjusted",
+                normalize=True,
+            )
+            break
+
+        except Exception as e:
+            # Every RIC of the request has an error status, e.g. no new bars yet
+            if isinstance(e, ek.EikonError) and e.code == -1:
+                print(f"No closes for {len(rics)} RICs: {e.message}")
+                return pd.DataFrame(columns=["RIC", "date", "CLOSE"])
+
+            retries += 1
+            print(f"Error getting stock prices for {len(rics)} RICs: {e}")
+            print(f"Retrying... ({retries}/{max_retries})")
+            # Sleep for 3 seconds before retrying
+            time.sleep(3)
+    else:
+        print(f"Failed to get stock prices for {rics} after {max_retries} retries")
+        return pd.DataFrame(columns=["RIC", "date", "CLOSE"])
+
+    # Long format, RICs without new bars have no rows
+    if res is None or "Field" not in res.columns:
+        return pd.DataFrame(columns=["RIC", "date", "CLOSE"])
+    res = res[res["Field"] == "CLOSE"]
+    return pd.DataFrame(
+        {
+            "RIC": res["Security"].astype(str).to_numpy(),
+            "date": pd.to_datetime(res["Date"]).dt.normalize().to_numpy(),
+            "CLOSE": res["Value"].astype(float).to_numpy(),
+        }
+    )
+
+
+def to_bars(closes: pd.DataFrame, market_closes: pd.Series) -> np.ndarray:
+    """Bars with the exchange close of every date, NaT on non-trading days."""
+    dates = pd.DatetimeIndex(closes["date"])
+    close_times = market_closes.dt.tz_convert(None).reindex(dates)
+
+    bars = np.empty(len(closes), dtype=BAR_DTYPE)
+    bars["date"] = dates.to_numpy().astype("datetime64[D]")
+    bars["close_time"] = close_times.to_numpy()
+    bars["close"] = closes["CLOSE"].to_numpy()
+    return bars
+
+
+def update_store(
+    rics: list[str],
+    exchanges: dict[str, str],
+    store_dir: str = STORE_DIR,
+    end: datetime.date | None = None,
+    full: bool = False,
+    max_points: int = MAX_POINTS,
+) -> dict:
+    """
+    Fetch the bars after the last stored one of every RIC.
+
+    Args:
+        rics: RICs to update
+        exchanges: Exchange of every RIC for the close timestamps
+        store_dir: Directory of the store
+        end: Last date to fetch, today if None (sessions still open are skipped)
+        full: Refetch the whole history from HISTORY_START
+        max_points: Data points per get_timeseries request
+
+    Returns:
+        Number of requests, bars stored and the RICs that got new bars
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    end = end or datetime.date.today()
+    # Close timestamps are stored as naive UTC
+    now = np.datetime64(
+        datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None), "ns"
+    )
+
+    starts = {}
+    for ric in rics:
+        last = None if full else last_date(bars_file(store_dir, ric))
+        starts[ric] = HISTORY_START if last is None else last + datetime.timedelta(1)
+    # Replaced once their new history has arrived
+    stale = set(rics) if full else set()
+
+    requests = plan_requests(starts, end, max_points)
+    stats = {"requests": len(requests), "bars": 0, "updated": []}
+    print(f"{len(rics)} RICs, {len(requests)} requests")
+    # Building a calendar is slow, RICs share them by exchange and start date
+    market_closes = {}
+
+    for start, chunk in requests:
+        print(f"Requesting {len(chunk)} RICs from {start}")
+        closes = fetch_closes(chunk, start, end)
+
+        for ric, ric_closes in closes.groupby("RIC", sort=False):
+            # Windows may overlap the stored bars on retries
+            ric_closes = ric_closes[ric_closes["date"].dt.date >= start]
+            if ric_closes.empty:
+                continue
+
+            key = (exchanges[ric], start)
+            if key not in market_closes:
+                market_closes[key] = get_market_closes(exchanges[ric], start, end)
+            bars = to_bars(ric_closes.sort_values("date"), market_closes[key])
+            # The last trade of a session still open is not its close, the next
+            # update starts from that day again
+            bars = bars[~(bars["close_time"] > now)]
+            if len(bars) == 0:
+                continue
+            if ric in stale and os.path.exists(bars_file(store_dir, ric)):
+                os.remove(bars_file(store_dir, ric))
+            stale.discard(ric)
+            append_bars(bars_file(store_dir, ric), bars)
+            stats["bars"] += len(bars)
+            stats["updated"].append(ric)
+
+    return stats
+
+
+def export_prices(
+    rics: list[str],
+    store_dir: str = STORE_DIR,
+    prices_dir: str = os.path.join("data", "prices"),
+) -> None:
+    """Write the stored bars as data/prices/ CSVs with close timestamps."""
+    os.makedirs(prices_dir, exist_ok=True)
+    for ric in rics:
+        bars = read_bars(bars_file(store_dir, ric))
+        df = pd.DataFrame(
+            {"CLOSE": bars["close"]},
+            index=pd.DatetimeIndex(bars["close_time"], name="Date").tz_localize("UTC"),
+        )
+        df.to_csv(os.path.join(prices_dir, f"{ric.replace('.', '-')}.csv"), index=True)
+
+
+def refresh_prices(
+    rics: list[str],
+    offline_exchanges: bool = False,
+    store_dir: str = STORE_DIR,
+    prices_dir: str = os.path.join("data", "prices"),
+    end: datetime.date | None = None,
+    full: bool = False,
+) -> dict:
+    if offline_exchanges:
+        exchanges = {ric: exchange_from_suffix(ric) for ric in rics}
+    else:
+        exchanges = get_exchanges(rics)
+
+    stats = update_store(rics, exchanges, store_dir, end, full)
+    # Also export RICs that are up to date but missing in the prices directory
+    export_prices(
+        [
+            ric
+            for ric in rics
+            if ric in stats["updated"]
+            or not os.path.exists(
+                os.path.join(prices_dir, f"{ric.replace('.', '-')}.csv")
+            )
+        ],
+        store_dir,
+        prices_dir,
+    )
+    print(
+        f"Stored {stats['bars']} new bars of {len(stats['updated'])} RICs "
+        f"in {stats['requests']} requests"
+    )
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--rics", nargs="+", help="RICs to update (default: all constituents)"
+    )
+    parser.add_argument("--end", type=datetime.date.fromisoformat, default=None)
+    parser.add_argument(
+        "--full", action="store_true", help="Refetch the whole history of the RICs"
+    )
+    parser.add_argument(
+        "--offline-exchanges",
+        action="store_true",
+        help="Derive exchanges from the RIC suffix instead of asking Eikon",
+    )
+    parser.add_argument("--store-dir", default=STORE_DIR)
+    parser.add_argument("--prices-dir", default=os.path.join("data", "prices"))
+    args = parser.parse_args()
+
+    import eikon as ek
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    ek.set_app_key(os.getenv("EIKON_APP_KEY"))
+
+    rics = args.rics
+    if rics is None:
+        constituents = pd.read_csv(os.path.join("data", "constituents.csv"))
+        rics = constituents["Instrument"].tolist()
+
+    refresh_prices(
+        rics,
+        args.offline_exchanges,
+        args.store_dir,
+        args.prices_dir,
+        args.end,
+        args.full,
+    )
+
+
+if __name__ == "__main__":
+    main()
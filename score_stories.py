@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Sentiment of the story bodies downloaded by download_articles.py.
+
+FinBERT reads at most 512 tokens, the predict.py pipeline would cut stories
+off after their first paragraphs. Every story is tokenized once and split into
+overlapping windows of tokens instead, and the windows of many stories (across
+all files) are packed into full batches: windows are buffered and sorted by
+length, so only the last window of a story needs padding. The logits of the
+windows of a story are averaged, weighted by their number of tokens, and the
+softmax of the average gives the label and score of the story. Stories are
+appended to data/stories_preds/<ticker>_stories.jsonl as soon as their last
+window is scored, an interrupted run continues with the stories still missing.
+"""
+
+import argparse
+import html
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+from headline_store import find_headlines_file, load_records
+from predict import MODEL_PATH
+
+# Windows buffered per batch, sorted by length before batching
+BUFFER_BATCHES = 32
+
+TAG_RE = re.compile(r"<(script|style)\b.*?</\1>|<[^>]+>", re.DOTALL | re.IGNORECASE)
+
+
+def story_text(story: dict | None) -> str:
+    """Plain text of a raw Eikon story, empty if the download failed."""
+    if not story or not (story.get("story") or {}).get("storyHtml"):
+        return ""
+    text = html.unescape(TAG_RE.sub(" ", story["story"]["storyHtml"]))
+    return " ".join(text.split())
+
+
+def make_windows(ids: list[int], size: int, overlap: int) -> list[list[int]]:
+    """Windows of at most size tokens, consecutive ones share overlap tokens."""
+    starts = range(0, max(len(ids) - overlap, 1), size - overlap)
+    return [ids[start : start + size] for start in starts]
+
+
+def pack_batches(windows, batch_size: int, buffer_batches: int = BUFFER_BATCHES):
+    """Batches of (key, window), windows of similar length end up together."""
+    buffer = []
+    for item in windows:
+        buffer.append(item)
+        if len(buffer) == batch_size * buffer_batches:
+            yield from sorted_batches(buffer, batch_size)
+            buffer = []
+    yield from sorted_batches(buffer, batch_size)
+
+
+def sorted_batches(buffer: list, batch_size: int):
+    buffer = sorted(buffer, key=lambda item: len(item[1]), reverse=True)
+    for start in range(0, len(buffer), batch_size):
+        yield buffer[start : start + batch_size]
+
+
+class StoryModel:
+    """Tokenizer and sequence classifier returning raw logits per window."""
+
+    def __init__(
+        self,
+        model_path: str = MODEL_PATH,
+        max_length: int = 512,
+        device: str | None = None,
+        fp16: bool = False,
+    ):
+        # Imported here, transformers and torch take seconds to import
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        self.torch = torch
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        model = AutoModelForSequenceClassification.from_pretrained(model_path)
+        self.model = (model.half() if fp16 else model).to(self.device).eval()
+
+        self.labels = [
+            self.model.config.id2label[i] for i in range(self.model.config.num_labels)
+        ]
+        # Room for [CLS] and [SEP]
+        self.window_size = max_length - self.tokenizer.num_special_tokens_to_add()
+
+    def tokenize(self, texts: list[str]) -> list[list[int]]:
+        # Whole stories, verbose=False silences the warnings about their length
+        return self.tokenizer(texts, add_special_tokens=False, verbose=False)[
+            "input_ids"
+        ]
+
+    def logits(self, windows: list[list[int]]) -> np.ndarray:
+        batch = self.tokenizer.pad(
+            {
+                "input_ids": [
+                    self.tokenizer.build_inputs_with_special_tokens(window)
+                    for window in windows
+                ]
+            },
+            return_tensors="pt",
+        )
+        with self.torch.inference_mode():
+            logits = self.model(**batch.to(self.device)).logits
+        return logits.float().cpu().numpy()
+
+
+def story_result(logits: np.ndarray, weight: int, labels: list[str]) -> dict:
+    """Label and score of the token-weighted mean of the window logits."""
+    mean = logits / weight
+    probabilities = np.exp(mean - mean.max())
+    probabilities /= probabilities.sum()
+    best = int(probabilities.argmax())
+    return {
+        "label": labels[best],
+        "score": float(probabilities[best]),
+        "probabilities": dict(zip(labels, probabilities.round(6).tolist())),
+    }
+
+
+def scored_ids(path: str) -> set[str]:
+    """Story ids already in an output file, a line cut off by a crash is dropped."""
+    if not os.path.exists(path):
+        return set()
+    ids = set()
+    with open(path, mode="rb+") as f:
+        end = 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            ids.add(json.loads(line)["storyId"])
+            end += len(line)
+        # Appended stories start on a line of their own
+        f.truncate(end)
+    return ids
+
+
+def score_stories(
+    model,
+    stories_dir: str = os.path.join("data", "stories"),
+    headlines_dir: str = os.path.join("data", "filtered_headlines"),
+    out_dir: str = os.path.join("data", "stories_preds"),
+    batch_size: int = 32,
+    overlap: int = 128,
+    max_windows: int | None = None,
+) -> dict:
+    """
+    Score all stories, streaming the results to one JSONL file per ticker.
+
+    Args:
+        model: StoryModel, or any object with its labels, window_size,
+            tokenize() and logits()
+        stories_dir: Output of download_articles.py
+        headlines_dir: Headlines the stories were downloaded for, in the same order
+        out_dir: Directory of the <ticker>_stories.jsonl outputs
+        batch_size: Windows per forward pass
+        overlap: Tokens shared by consecutive windows of a story
+        max_windows: Only score the first windows of very long stories
+
+    Returns:
+        Numbers of stories, windows, tokens and padding tokens and the time taken
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    stats = {"stories": 0, "windows": 0, "tokens": 0, "padding": 0}
+
+    # Per story: ticker, metadata, windows left, summed logits and tokens
+    pending = {}
+    # Per ticker: open output file and stories left
+    outputs = {}
+
+    def windows():
+        for file in sorted(os.listdir(stories_dir)):
+            if not file.endswith("_stories.json"):
+                continue
+
+            ticker = file[: -len("_stories.json")]
+            out_path = os.path.join(out_dir, f"{ticker}_stories.jsonl")
+            with open(os.path.join(stories_dir, file), mode="r", encoding="utf-8") as f:
+                stories = json.load(f)
+            headlines = load_records(find_headlines_file(headlines_dir, ticker))
+            if len(headlines) != len(stories):
+                print(f"Skipping {file}, its headlines changed since the download")
+                continue
+
+            done = scored_ids(out_path)
+            todo = [
+                (headline, text)
+                for headline, text in zip(headlines, map(story_text, stories))
+                if text and headline["storyId"] not in done
+            ]
+            token_ids = model.tokenize([text for _, text in todo]) if todo else []
+            todo = [
+                (headline, ids)
+                for (headline, _), ids in zip(todo, token_ids)
+                if ids
+            ]
+            print(f"{file}: {len(todo)} stories to score, {len(done)} already scored")
+            if not todo:
+                continue
+
+            outputs[ticker] = [open(out_path, mode="a", encoding="utf-8"), len(todo)]
+            for i, (headline, ids) in enumerate(todo):
+                story_windows = make_windows(ids, model.window_size, overlap)
+                story_windows = story_windows[:max_windows]
+                pending[ticker, i] = {
+                    "ticker": ticker,
+                    "meta": {
+                        "storyId": headline["storyId"],
+                        "versionCreated": headline["versionCreated"],
+                        "windows": len(story_windows),
+                        "tokens": len(ids),
+                    },
+                    "left": len(story_windows),
+                    "logits": 0.0,
+                    "weight": 0,
+                }
+                yield from (((ticker, i), window) for window in story_windows)
+
+    start = time.perf_counter()
+    for batch in pack_batches(windows(), batch_size):
+        logits = model.logits([window for _, window in batch])
+        longest = max(len(window) for _, window in batch)
+        stats["windows"] += len(batch)
+        stats["tokens"] += sum(len(window) for _, window in batch)
+        stats["padding"] += sum(longest - len(window) for _, window in batch)
+
+        for (key, window), window_logits in zip(batch, logits):
+            story = pending[key]
+            story["logits"] = story["logits"] + window_logits * len(window)
+            story["weight"] += len(window)
+            story["left"] -= 1
+            if story["left"]:
+                continue
+
+            # Last window of the story, write it out right away
+            del pending[key]
+            result = story_result(story["logits"], story["weight"], model.labels)
+            output = outputs[story["ticker"]]
+            output[0].write(json.dumps({**story["meta"], **result}) + "\n")
+            output[0].flush()
+            output[1] -= 1
+            if output[1] == 0:
+                output[0].close()
+            stats["stories"] += 1
+
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--stories-dir", default=os.path.join("data", "stories"))
+    parser.add_argument(
+        "--headlines-dir", default=os.path.join("data", "filtered_headlines")
+    )
+    parser.add_argument("--out-dir", default=os.path.join("data", "stories_preds"))
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-length", type=int, default=512)
+    parser.add_argument(
+        "--overlap", type=int, default=128, help="Tokens shared by adjacent windows"
+    )
+    parser.add_argument(
+        "--max-windows", type=int, help="Only score the first windows of a story"
+    )
+    parser.add_argument("--device", help="Torch device (default: cuda if available)")
+    parser.add_argument("--fp16", action="store_true", help="Half precision weights")
+    args = parser.parse_args()
+
+    model = StoryModel(args.model, args.max_length, args.device, args.fp16)
+    if not 0 <= args.overlap < model.window_size:
+        parser.error(f"--overlap must be below the window of {model.window_size}")
+
+    stats = score_stories(
+        model,
+        args.stories_dir,
+        args.headlines_dir,
+        args.out_dir,
+        args.batch_size,
+        args.overlap,
+        args.max_windows,
+    )
+
+    seconds = max(stats["seconds"], 1e-9)
+    print(
+        f"Scored {stats['stories']} stories in {stats['windows']} windows "
+        f"({stats['tokens']} tokens) in {seconds:.1f} s: "
+        f"{stats['stories'] / seconds:.1f} stories/s, "
+        f"{stats['windows'] / seconds:.1f} windows/s, "
+        f"{stats['padding'] / max(stats['tokens'] + stats['padding'], 1):.1%} padding"
+    )
+
+
+if __name__ == "__main__":
+    main()
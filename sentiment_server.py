@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Local sentiment inference server that keeps models warm between runs.
+
+Loading FinBERT and warming it up takes far longer than predicting a few
+thousand headlines, and every run of predict.py, benchmark_models.py or the
+pipeline paid it again. This server loads each model once (on first use or
+with --models) and serves POST /predict {"model": ..., "texts": [...]} over
+localhost HTTP or a Unix socket. Concurrent requests for the same model are
+batched dynamically: a batch is run once it reaches --max-batch headlines or
+--max-wait-ms after its first request arrived.
+
+The scripts use it through predict.SentimentClient, e.g. predict.py --server
+http://127.0.0.1:8765 or --server unix:/tmp/finsent.sock.
+"""
+
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+
+class DynamicBatcher:
+    """Runs the requests for one model in batches, one batch at a time."""
+
+    def __init__(self, nlp, max_batch: int, max_wait: float):
+        self.nlp = nlp
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue()
+        # One inference at a time, torch parallelises within a batch itself
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.batches = 0
+        self.texts = 0
+        self.task = asyncio.create_task(self.run())
+
+    async def predict(self, texts: list[str]) -> list[dict]:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((texts, future))
+        return await future
+
+    async def next_requests(self) -> list:
+        loop = asyncio.get_running_loop()
+        requests = [await self.queue.get()]
+        size = len(requests[0][0])
+        deadline = loop.time() + self.max_wait
+
+        while size < self.max_batch:
+            try:
+                request = await asyncio.wait_for(
+                    self.queue.get(), max(deadline - loop.time(), 0)
+                )
+            except asyncio.TimeoutError:
+                break
+            requests.append(request)
+            size += len(request[0])
+
+        return requests
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            requests = await self.next_requests()
+            texts = [text for request_texts, _ in requests for text in request_texts]
+
+            try:
+                results = await loop.run_in_executor(
+                    self.executor,
+                    lambda: self.nlp(texts, batch_size=min(len(texts), self.max_batch)),
+                )
+            except Exception as e:
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.texts += len(texts)
+
+            # Hand every request its slice of the batch
+            start = 0
+            for request_texts, future in requests:
+                future.set_result(results[start : start + len(request_texts)])
+                start += len(request_texts)
+
+
+def make_app(loader, max_batch: int, max_wait: float, preload: list[str] = ()):
+    """
+    Args:
+        loader: Function returning a sentiment pipeline for a model path
+        max_batch: Headlines after which a batch is run without waiting
+        max_wait: Seconds a batch waits for more requests after the first one
+        preload: Models to load at startup
+    """
+    batchers = {}
+    locks = {}
+    started = time.time()
+
+    async def get_batcher(model: str) -> DynamicBatcher:
+        if model not in batchers:
+            async with locks.setdefault(model, asyncio.Lock()):
+                if model not in batchers:
+                    print(f"Loading {model}...")
+                    start = time.perf_counter()
+                    # Loading takes seconds, keep serving the loaded models
+                    nlp = await asyncio.get_running_loop().run_in_executor(
+                        None, loader, model
+                    )
+                    batchers[model] = DynamicBatcher(nlp, max_batch, max_wait)
+                    print(f"Loaded {model} in {time.perf_counter() - start:.1f} s")
+        return batchers[model]
+
+    async def predict(request: web.Request) -> web.Response:
+        body = await request.json()
+        try:
+            batcher = await get_batcher(body["model"])
+            results = await batcher.predict(body["texts"])
+        except Exception as e:
+            return web.json_response({"error": str(e)}, status=500)
+        return web.json_response({"results": results})
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "uptime_s": time.time() - started,
+                "models": {
+                    model: {"batches": b.batches, "texts": b.texts}
+                    for model, b in batchers.items()
+                },
+            }
+        )
+
+    async def on_startup(app: web.Application) -> None:
+        for model in preload:
+            await get_batcher(model)
+
+    app = web.Application(client_max_size=256 * 1024**2)
+    app.router.add_post("/predict", predict)
+    app.router.add_get("/health", health)
+    app.on_startup.append(on_startup)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", help="Listen on this Unix socket instead")
+    parser.add_argument(
+        "--models", nargs="*", default=[], help="Models to load at startup"
+    )
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    args = parser.parse_args()
+
+    from predict import load_pipeline
+
+    app = make_app(load_pipeline, args.max_batch, args.max_wait_ms / 1000, args.models)
+    if args.socket:
+        web.run_app(app, path=args.socket)
+    else:
+        web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Stream headlines through filtering and FinBERT into next-close sentiment buckets.
+
+A long-running counterpart of steps 3-6 for live use: headlines arriving from a
+feed are filtered inline (is_excluded_headline and the consecutive-duplicate
+check of filter_headlines.py), micro-batched through FinBERT and added to the
+running SENTIMENT of their ticker's upcoming market close, using the exchange
+calendars of add_timestamps.py. Buckets are written to data/stream/ once the
+feed time passes their close.
+
+The feed is a replay of stored headlines from data/headlines/ in creation time
+order, optionally paced (--speed 3600 replays an hour per second). End-to-end
+latencies from a headline leaving the feed to its bucket being updated are
+reported as percentiles at the end.
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import statistics
+import time
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from add_timestamps import exchange_from_suffix, get_exchanges, get_market_closes
+from aggregate_test import SENTIMENT_SCORES
+from filter_headlines import is_excluded_headline
+
+# Margin after the last headline for which closes are looked up, so that
+# headlines from a long weekend still find their next close
+CALENDAR_MARGIN = pd.Timedelta(days=10)
+
+
+def load_replay(
+    headlines_dir: str, start: str | None = None, end: str | None = None
+) -> list[tuple[pd.Timestamp, str, dict]]:
+    """Stored headlines of all tickers as (created, ticker, headline), oldest first."""
+    events = []
+    for file in sorted(os.listdir(headlines_dir)):
+        if not file.endswith("_headlines.json"):
+            continue
+
+        ticker = file.split("_headlines")[0]
+        with open(os.path.join(headlines_dir, file), mode="r") as f:
+            headlines = json.load(f)
+
+        created = pd.to_datetime([h["versionCreated"] for h in headlines], utc=True)
+        events.extend(zip(created, [ticker] * len(headlines), headlines))
+
+    events.sort(key=lambda event: event[0])
+
+    if start is not None:
+        events = [e for e in events if e[0] >= pd.Timestamp(start, tz="UTC")]
+    if end is not None:
+        events = [e for e in events if e[0] < pd.Timestamp(end, tz="UTC")]
+    return events
+
+
+async def replay_feed(events, queue: asyncio.Queue, speed: float) -> None:
+    """
+    Put (sent, ticker, headline) on the queue, paced by creation time divided
+    by speed (0 replays as fast as possible), and None at the end.
+    """
+    if events:
+        feed_start, wall_start = events[0][0], time.perf_counter()
+
+    for created, ticker, headline in events:
+        if speed > 0:
+            due = (created - feed_start).total_seconds() / speed
+            delay = due - (time.perf_counter() - wall_start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        await queue.put((time.perf_counter(), ticker, headline))
+
+    await queue.put(None)
+
+
+class SentimentBuckets:
+    """Running sentiment of every ticker's upcoming market closes."""
+
+    def __init__(self, closes: dict[str, pd.Series], out_path: str):
+        # Close timestamps as naive UTC for searchsorted
+        self.closes = {
+            ticker: pd.DatetimeIndex(series).tz_convert(None).to_numpy()
+            for ticker, series in closes.items()
+        }
+        self.sentiment = defaultdict(int)
+        self.volume = defaultdict(int)
+
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+        self.out = open(out_path, mode="w", newline="")
+        self.writer = csv.writer(self.out)
+        self.writer.writerow(["TICKER", "Date", "SENTIMENT", "VOLUME"])
+
+    def next_close(self, ticker: str, created: pd.Timestamp):
+        closes = self.closes[ticker]
+        i = np.searchsorted(closes, created.tz_convert(None).to_datetime64())
+        return closes[i] if i < len(closes) else None
+
+    def add(self, ticker: str, close, score: int) -> None:
+        self.sentiment[ticker, close] += score
+        self.volume[ticker, close] += 1
+
+    def finalise(self, now=None) -> int:
+        """Write the buckets closed before now (all of them if None)."""
+        done = [
+            key
+            for key in self.sentiment
+            if now is None or key[1] < now.tz_convert(None).to_datetime64()
+        ]
+        for key in sorted(done, key=lambda key: (key[1], key[0])):
+            ticker, close = key
+            self.writer.writerow(
+                [
+                    ticker,
+                    pd.Timestamp(close, tz="UTC").isoformat(),
+                    self.sentiment.pop(key),
+                    self.volume.pop(key),
+                ]
+            )
+        self.out.flush()
+        return len(done)
+
+    def close(self) -> None:
+        self.finalise()
+        self.out.close()
+
+
+async def next_batch(queue: asyncio.Queue, accept, max_batch: int, max_wait: float):
+    """
+    Collect accepted headlines until the batch is full or max_wait seconds after
+    its first headline. Returns the batch and whether the feed has ended.
+    """
+    loop = asyncio.get_running_loop()
+    batch, deadline = [], None
+
+    while len(batch) < max_batch:
+        if deadline is None:
+            item = await queue.get()
+        else:
+            try:
+                item = await asyncio.wait_for(
+                    queue.get(), max(deadline - loop.time(), 0)
+                )
+            except asyncio.TimeoutError:
+                break
+
+        if item is None:
+            return batch, True
+
+        if accept(item):
+            batch.append(item)
+            if deadline is None:
+                deadline = loop.time() + max_wait
+
+    return batch, False
+
+
+async def stream(
+    queue: asyncio.Queue,
+    nlp,
+    buckets: SentimentBuckets,
+    max_batch: int = 32,
+    max_wait: float = 0.05,
+) -> dict:
+    stats = defaultdict(int)
+    latencies = []
+    previous_text_lower = {}
+
+    def accept(item) -> bool:
+        _, ticker, headline = item
+        stats["total"] += 1
+        text_lower = headline.get("text", "").lower()
+
+        if is_excluded_headline(headline):
+            stats["filtered_out"] += 1
+            return False
+        # Check for consecutive duplicate text (case-insensitive) per ticker
+        if text_lower == previous_text_lower.get(ticker):
+            stats["duplicates_removed"] += 1
+            stats["filtered_out"] += 1
+            return False
+
+        previous_text_lower[ticker] = text_lower
+        return True
+
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    ended = False
+    while not ended:
+        batch, ended = await next_batch(queue, accept, max_batch, max_wait)
+        if not batch:
+            continue
+
+        # Inference in a thread so that the feed keeps being consumed
+        texts = [headline["text"] for _, _, headline in batch]
+        results = await loop.run_in_executor(
+            None, lambda: nlp(texts, batch_size=len(texts))
+        )
+        stats["batches"] += 1
+
+        for (sent, ticker, headline), result in zip(batch, results):
+            created = pd.Timestamp(headline["versionCreated"]).tz_convert("UTC")
+            close = buckets.next_close(ticker, created)
+            if close is None:
+                stats["no_close"] += 1
+                continue
+
+            buckets.add(ticker, close, SENTIMENT_SCORES[result["label"].lower()])
+            stats["kept"] += 1
+            latencies.append(time.perf_counter() - sent)
+
+        # The feed time has moved past every close before the newest headline
+        stats["buckets"] += buckets.finalise(now=created)
+
+    stats["buckets"] += buckets.finalise()
+    stats["elapsed_s"] = time.perf_counter() - start
+    stats["latencies"] = latencies
+    return dict(stats)
+
+
+def print_report(stats: dict) -> None:
+    latencies_ms = np.array(stats.pop("latencies")) * 1000
+
+    print("\n" + "=" * 60)
+    print("STREAMING SUMMARY")
+    print("=" * 60)
+    print(f"Headlines received: {stats.get('total', 0):,}")
+    print(f"Filtered out: {stats.get('filtered_out', 0):,}")
+    print(f"  - Consecutive duplicates: {stats.get('duplicates_removed', 0):,}")
+    print(f"Scored: {stats.get('kept', 0):,} in {stats.get('batches', 0):,} batches")
+    print(f"Without upcoming close: {stats.get('no_close', 0):,}")
+    print(f"Close buckets written: {stats.get('buckets', 0):,}")
+    print(f"Throughput: {stats.get('total', 0) / stats['elapsed_s']:.1f} headlines/s")
+
+    if len(latencies_ms):
+        p50, p90, p99 = np.percentile(latencies_ms, [50, 90, 99])
+        print(
+            f"End-to-end latency: p50 {p50:.1f} ms, p90 {p90:.1f} ms, "
+            f"p99 {p99:.1f} ms, max {latencies_ms.max():.1f} ms "
+            f"(mean {statistics.fmean(latencies_ms):.1f} ms)"
+        )
+
+
+def ticker_closes(tickers, first, last, offline_exchanges: bool) -> dict:
+    if not offline_exchanges:
+        import eikon as ek
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        ek.set_app_key(os.getenv("EIKON_APP_KEY"))
+
+    rics = {ticker: ticker.replace("-", ".") for ticker in tickers}
+    if offline_exchanges:
+        exchanges = {ric: exchange_from_suffix(ric) for ric in rics.values()}
+    else:
+        exchanges = get_exchanges(list(rics.values()))
+
+    closes = {}
+    for ticker, ric in rics.items():
+        closes[ticker] = get_market_closes(
+            exchanges[ric], first.date(), (last + CALENDAR_MARGIN).date()
+        )
+    return closes
+
+
+async def run(args, nlp) -> dict:
+    events = load_replay(args.headlines_dir, args.start, args.end)
+    print(f"Replaying {len(events):,} headlines")
+    if not events:
+        return {}
+
+    tickers = sorted({ticker for _, ticker, _ in events})
+    buckets = SentimentBuckets(
+        ticker_closes(tickers, events[0][0], events[-1][0], args.offline_exchanges),
+        args.out,
+    )
+
+    queue = asyncio.Queue(maxsize=args.queue_size)
+    feed = asyncio.create_task(replay_feed(events, queue, args.speed))
+    try:
+        stats = await stream(
+            queue, nlp, buckets, args.max_batch, args.max_wait_ms / 1000
+        )
+        await feed
+    finally:
+        buckets.close()
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--headlines-dir", default=os.path.join("data", "headlines"))
+    parser.add_argument("--start", help="Replay headlines from this date on")
+    parser.add_argument("--end", help="Replay headlines before this date")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=0,
+        help="Replay speed-up over real time, 0 replays as fast as possible",
+    )
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument(
+        "--max-wait-ms",
+        type=float,
+        default=50,
+        help="Longest time a headline waits for its batch to fill up",
+    )
+    parser.add_argument("--queue-size", type=int, default=10_000)
+    parser.add_argument(
+        "--offline-exchanges",
+        action="store_true",
+        help="Derive exchanges from the RIC suffix instead of asking Eikon",
+    )
+    parser.add_argument("--model", default=None, help="FinBERT model path")
+    parser.add_argument(
+        "--server",
+        help="Predict on a running sentiment_server.py (default: $SENTIMENT_SERVER)",
+    )
+    parser.add_argument(
+        "--out", default=os.path.join("data", "stream", "sentiment.csv")
+    )
+    args = parser.parse_args()
+
+    from predict import MODEL_PATH, load_nlp
+
+    nlp = load_nlp(args.model or MODEL_PATH, args.server)
+    stats = asyncio.run(run(args, nlp))
+    if stats:
+        print_report(stats)
+
+
+if __name__ == "__main__":
+    main()
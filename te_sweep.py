@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Sweep transfer entropy settings in one run.
+
+Checking the robustness of the network to kraskov_k, the maximum lags or the
+significance levels meant editing SETTINGS in transfer_entropy.py and rerunning
+the whole analysis per combination. The sweep takes a grid of settings, e.g.
+
+    python3 te_sweep.py --grid kraskov_k=3,4,5 max_lag_sources=3,5 alpha=0.01,0.05
+
+and runs the single-target analyses of all grid points on a process pool. The
+panel is loaded and normalised once and sent to every worker once. Grid points
+that only differ in the network-level FDR settings share their analyses, the
+correction is applied to the combined results afterwards. Every run of a target
+starts from the same random state, so all grid points are tested against the
+same surrogates. The results end up in one table with a row per grid point.
+"""
+
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
+
+import numpy as np
+import pandas as pd
+
+from transfer_entropy import (
+    SETTINGS,
+    prepare_data,
+    resolve_estimator,
+    selected_edges,
+)
+
+# Only used by the network-level FDR correction after the per-target analyses
+FDR_KEYS = ("fdr_correction", "alpha_fdr", "fdr_constant", "correct_by_target")
+# The "alpha" grid key sets all significance levels at once
+ALPHA_KEYS = (
+    "alpha_max_stat",
+    "alpha_min_stat",
+    "alpha_omnibus",
+    "alpha_max_seq",
+    "alpha_fdr",
+)
+
+# IDTxl data of the worker process, set once when the worker starts
+_data = None
+
+
+def parse_value(value: str):
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    if value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    return value
+
+
+def parse_grid(specs: list[str]) -> dict[str, list]:
+    """Values of every swept setting from "key=value1,value2" arguments."""
+    grid = {}
+    for spec in specs:
+        key, _, values = spec.partition("=")
+        if key != "alpha" and key not in SETTINGS:
+            raise ValueError(f"Unknown setting {key}")
+        grid[key] = [parse_value(value) for value in values.split(",")]
+    return grid
+
+
+def full_settings(point: dict, base: dict = SETTINGS) -> dict:
+    settings = {**base, "verbose": False}
+    for key, value in point.items():
+        if key == "alpha":
+            settings.update(dict.fromkeys(ALPHA_KEYS, value))
+        else:
+            settings[key] = value
+    return settings
+
+
+def analysis_key(settings: dict) -> tuple:
+    """Settings of the single-target analyses, equal keys share the runs."""
+    return tuple(sorted((k, v) for k, v in settings.items() if k not in FDR_KEYS))
+
+
+def init_worker(data) -> None:
+    global _data
+    _data = data
+
+
+def analyse_target(settings: dict, target: int, seed: int):
+    from idtxl.multivariate_te import MultivariateTE
+
+    # IDTxl draws the surrogates from numpy's global random state
+    np.random.seed(seed + target)
+    start = time.perf_counter()
+    result = MultivariateTE().analyse_single_target(
+        settings=resolve_estimator(dict(settings)), data=_data, target=target
+    )
+    return result, time.perf_counter() - start
+
+
+def sweep(
+    df: pd.DataFrame,
+    grid: dict[str, list],
+    targets: list[int] | str = "all",
+    workers: int = 4,
+    seed: int = 0,
+    base: dict = SETTINGS,
+) -> pd.DataFrame:
+    """
+    Analyse the panel with every combination of the grid values.
+
+    Args:
+        df: Panel from transfer_entropy.prepare_data()
+        grid: Values of every swept setting, "alpha" for all significance levels
+        targets: Process indices to analyse
+        workers: Processes of the pool
+        seed: Random state of the surrogates, shared by all grid points
+        base: Settings that are not swept
+
+    Returns:
+        One row per grid point with its settings, the number of edges before and
+        after the FDR correction, the edges and the summed analysis time
+    """
+    from idtxl.data import Data
+    from idtxl.stats import network_fdr
+
+    # Normalised once for all runs
+    data = Data(df, dim_order="sp")
+    if targets == "all":
+        targets = list(range(data.n_processes))
+
+    points = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+    settings = [full_settings(point, base) for point in points]
+    analyses = {}
+    for point_settings in settings:
+        analyses.setdefault(analysis_key(point_settings), point_settings)
+    print(
+        f"{len(points)} grid points, {len(analyses)} analyses of "
+        f"{len(targets)} targets on {workers} workers"
+    )
+
+    combined = {}
+    pool = ProcessPoolExecutor(workers, initializer=init_worker, initargs=(data,))
+    with pool:
+        futures = {
+            (key, target): pool.submit(analyse_target, analysis, target, seed)
+            for key, analysis in analyses.items()
+            for target in targets
+        }
+        for i, key in enumerate(analyses, start=1):
+            per_target = [futures[key, target].result() for target in targets]
+            results = deepcopy(per_target[0][0])
+            results.combine_results(*[result for result, _ in per_target[1:]])
+            combined[key] = (results, sum(seconds for _, seconds in per_target))
+            print(f"Finished analysis {i}/{len(analyses)}")
+
+    columns = list(df.columns)
+    rows, first = [], None
+    for point, point_settings in zip(points, settings):
+        results, seconds = combined[analysis_key(point_settings)]
+        uncorrected = selected_edges(results, targets, fdr=False)
+        edges = uncorrected
+        if point_settings["fdr_correction"]:
+            corrected = network_fdr(dict(point_settings), results)
+            edges = selected_edges(corrected, targets, fdr=True)
+
+        # Agreement of the source -> target pairs with the first grid point
+        pairs = {(source, target) for source, target, _ in edges}
+        first = pairs if first is None else first
+        union = pairs | first
+        rows.append(
+            {
+                **point,
+                "edges_uncorrected": len(uncorrected),
+                "edges": len(edges),
+                "jaccard_first": len(pairs & first) / len(union) if union else 1.0,
+                "analysis_s": seconds,
+                "edge_list": "; ".join(
+                    f"{columns[source]} -> {columns[target]} ({lag})"
+                    for source, target, lag in sorted(edges)
+                ),
+            }
+        )
+
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--grid",
+        nargs="+",
+        required=True,
+        help='Swept settings as "key=value1,value2", "alpha" sets all alpha levels',
+    )
+    parser.add_argument("--aggregate-dir", default=os.path.join("data", "aggregate"))
+    parser.add_argument(
+        "--frequency",
+        help="Bar frequency to load from a multi-frequency panel in --aggregate-dir",
+    )
+    parser.add_argument("--features", nargs="+", default=["SENTIMENT"])
+    parser.add_argument(
+        "--targets",
+        choices=["all", "returns"],
+        default="all",
+        help="Analyse every process or only the returns",
+    )
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=os.path.join("data", "te_sweep.csv"))
+    args = parser.parse_args()
+
+    try:
+        grid = parse_grid(args.grid)
+    except ValueError as e:
+        parser.error(str(e))
+
+    df = prepare_data(
+        args.aggregate_dir,
+        verbose=False,
+        frequency=args.frequency,
+        features=args.features,
+    )
+    targets = args.targets
+    if targets == "returns":
+        targets = [i for i, c in enumerate(df.columns) if c.endswith("_LOG_RETURNS")]
+
+    report = sweep(df, grid, targets, args.workers, args.seed)
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    report.to_csv(args.out, index=False)
+
+    print(report.drop(columns="edge_list").to_string(index=False))
+    print(f"\nSweep results saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
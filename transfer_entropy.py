@@ -1,17 +1,68 @@
+from copy import deepcopy
 from datetime import datetime
+import argparse
+import importlib
 import os
 
-import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
-from idtxl.data import Data
-from idtxl.multivariate_te import MultivariateTE
-from idtxl.visualise_graph import plot_network
 
+from aggregate_test import FEATURE_DTYPES, FEATURES
 
-def prepare_data():
-    # Load data
-    aggregate_dir = os.path.join("data", "aggregate")
+# IDTxl and matplotlib (with pyopencl, jpype, ...) take long to import, they are
+# only imported by the functions that need them
+
+# Estimators from this repository as (module, class), IDTxl only finds its own
+# ones by name
+ESTIMATORS = {"MixedKraskovCMI": ("mixed_cmi", "MixedKraskovCMI")}
+
+# Columns of data/constituents.csv the panel can be grouped by
+GROUP_COLUMNS = {
+    "sector": "TRBC Economic Sector Name",
+    "country": "Country of Headquarters",
+}
+MARKET_CAP_COLUMN = "Company Market Cap"
+
+SETTINGS = {
+    # "MixedKraskovCMI" treats the integer SENTIMENT columns as discrete
+    "cmi_estimator": "OpenCLKraskovCMI",
+    "kraskov_k": 4,
+    "noise_level": 0.0,
+    "max_lag_sources": 5,
+    "min_lag_sources": 1,
+    "max_lag_target": 5,
+    "tau_sources": 1,
+    "tau_target": 1,
+    "n_perm_max_stat": 500,
+    "n_perm_min_stat": 500,
+    "n_perm_omnibus": 20000,
+    "n_perm_max_seq": 20000,
+    "alpha_max_stat": 0.05,
+    "alpha_min_stat": 0.05,
+    "alpha_omnibus": 0.05,
+    "alpha_max_seq": 0.05,
+    "alpha_fdr": 0.05,
+    "fdr_correction": True,
+    "fdr_constant": 2,
+    "correct_by_target": True,
+    "verbose": True,
+}
 
+
+def prepare_data(
+    aggregate_dir=os.path.join("data", "aggregate"),
+    verbose=True,
+    frequency=None,
+    features=("SENTIMENT",),
+):
+    # Panels from aggregate_multifreq.py are partitioned by frequency
+    if frequency is not None:
+        aggregate_dir = os.path.join(aggregate_dir, f"freq={frequency}")
+    # Daily closes differ across exchanges and are aligned by date, intraday
+    # bars end at the same UTC times everywhere
+    daily = frequency in (None, "1D")
+
+    # Load data
     dfs = []
     all_dates = set()
 
@@ -22,12 +73,17 @@ def prepare_data():
 
         file_path = os.path.join(aggregate_dir, file)
 
-        # Load the CSV
-        temp_df = pd.read_csv(file_path, parse_dates=["Date"])
+        # Load the CSV, only the selected sentiment features next to the returns
+        temp_df = pd.read_csv(
+            file_path,
+            parse_dates=["Date"],
+            usecols=["Date", *features, "LOG_RETURNS"],
+            dtype={feature: FEATURE_DTYPES[feature] for feature in features},
+        )
         temp_df.dropna(subset=["LOG_RETURNS"], inplace=True)
-        temp_df.drop(columns=["CLOSE"], inplace=True)
         # Keep only the date part from the 'Date' column
-        temp_df["Date"] = temp_df["Date"].dt.date
+        if daily:
+            temp_df["Date"] = temp_df["Date"].dt.date
 
         # Collect all dates
         all_dates.update(temp_df["Date"])
@@ -59,58 +115,200 @@ def prepare_data():
     # Sort columns alphabetically
     df = df.sort_index(axis=1)
 
-    print(df.head())
+    if verbose:
+        print(df.head())
 
-    # Check for NaN values in the dataframe
-    nan_counts = df.isna().sum()
-    print("NaN counts per column:")
-    print(nan_counts[nan_counts > 0])
+        # Check for NaN values in the dataframe
+        nan_counts = df.isna().sum()
+        print("NaN counts per column:")
+        print(nan_counts[nan_counts > 0])
 
     return df
 
 
-if __name__ == "__main__":
-    df = prepare_data()
+def load_groups(
+    level: str, constituents_path: str = os.path.join("data", "constituents.csv")
+) -> pd.DataFrame:
+    """Group and market cap of every ticker, indexed like the aggregate files."""
+    constituents = pd.read_csv(constituents_path)
+    caps = constituents[MARKET_CAP_COLUMN]
+    if caps.isna().any():
+        print(f"No market cap for {caps.isna().sum()} constituents, using the median")
 
-    # Print the column names with their indices
-    print("Columns in the DataFrame:")
-    print([f"{i}: {col}" for i, col in enumerate(df.columns)])
+    return pd.DataFrame(
+        {
+            "group": constituents[GROUP_COLUMNS[level]]
+            .fillna("Unknown")
+            .str.replace(" ", "-")
+            .to_numpy(),
+            "cap": caps.fillna(caps.median()).to_numpy(),
+        },
+        index=constituents["Instrument"].str.replace(".", "-", regex=False),
+    )
 
-    # exit()
+
+def group_panel(df: pd.DataFrame, groups: pd.DataFrame) -> pd.DataFrame:
+    """
+    Panel with one set of columns per group instead of per constituent.
+
+    Returns are cap-weighted over the constituents with a return on the date
+    (as simple returns, then logged again), features aggregated by mean in
+    aggregate_test.py are cap-weighted means and all others are summed.
+    """
+    tickers = {column: column.split("_", 1)[0] for column in df.columns}
+    missing = sorted(set(tickers.values()) - set(groups.index))
+    if missing:
+        raise ValueError(f"No group for {missing} in the constituents")
+    features = sorted({column.split("_", 1)[1] for column in df.columns})
+
+    grouped = {}
+    members = groups[groups.index.isin(list(tickers.values()))]
+    for group, group_members in members.groupby("group"):
+        for feature in features:
+            values = df[[f"{ticker}_{feature}" for ticker in group_members.index]]
+            weights = values.notna() * group_members["cap"].to_numpy()
+
+            if feature == "LOG_RETURNS":
+                total = (np.exp(values) * weights).sum(axis=1)
+                value = np.log(total / weights.sum(axis=1))
+            elif FEATURES[feature][1] == "mean":
+                value = (values * weights).sum(axis=1) / weights.sum(axis=1)
+            else:
+                value = values.sum(axis=1, min_count=1)
+            grouped[f"{group}_{feature}"] = value
+
+    return pd.DataFrame(grouped).sort_index(axis=1)
+
+
+def resolve_estimator(settings: dict) -> dict:
+    """Replace the name of an estimator from this repository by its class."""
+    name = settings["cmi_estimator"]
+    if isinstance(name, str) and name in ESTIMATORS:
+        module, class_name = ESTIMATORS[name]
+        settings["cmi_estimator"] = getattr(importlib.import_module(module), class_name)
+    return settings
+
+
+def run_analysis(df, settings=None):
+    from idtxl.data import Data
+    from idtxl.multivariate_te import MultivariateTE
+
+    # IDTxl fills in defaults in place, never hand it the module-level dict
+    settings = resolve_estimator(dict(SETTINGS if settings is None else settings))
 
     data = Data(df, dim_order="sp")
 
-    # Initialise analysis object and define settings
+    # Initialise analysis object
     network_analysis = MultivariateTE()
 
-    settings = {
-        "cmi_estimator": "OpenCLKraskovCMI",
-        "kraskov_k": 4,
-        "noise_level": 0.0,
-        "max_lag_sources": 5,
-        "min_lag_sources": 1,
-        "max_lag_target": 5,
-        "tau_sources": 1,
-        "tau_target": 1,
-        "n_perm_max_stat": 500,
-        "n_perm_min_stat": 500,
-        "n_perm_omnibus": 20000,
-        "n_perm_max_seq": 20000,
-        "alpha_max_stat": 0.05,
-        "alpha_min_stat": 0.05,
-        "alpha_omnibus": 0.05,
-        "alpha_max_seq": 0.05,
-        "alpha_fdr": 0.05,
-        "fdr_correction": True,
-        "fdr_constant": 2,
-        "correct_by_target": True,
-        "verbose": True,
-    }
-
     print(f"Startging analysis with settings: {settings}")
 
     # Run analysis
-    results = network_analysis.analyse_network(settings=settings, data=data)
+    return network_analysis.analyse_network(settings=settings, data=data)
+
+
+def run_analysis_mpi(df, settings=None):
+    """
+    Analyse the targets split round-robin across the MPI ranks.
+
+    Every rank runs the single-target analyses of its share of the targets,
+    rank 0 gathers them and applies the network-level FDR correction like
+    analyse_network does.
+
+    Returns:
+        Combined network results on rank 0, None on the other ranks
+    """
+    from idtxl.data import Data
+    from idtxl.multivariate_te import MultivariateTE
+    from idtxl.stats import network_fdr
+    from mpi4py import MPI
+
+    comm = MPI.COMM_WORLD
+    rank, size = comm.Get_rank(), comm.Get_size()
+
+    settings = resolve_estimator(dict(SETTINGS if settings is None else settings))
+    data = Data(df, dim_order="sp")
+    targets = list(range(data.n_processes))[rank::size]
+
+    print(f"Rank {rank}/{size}: analysing targets {targets}")
+
+    # Each target needs its own settings copy, IDTxl modifies them in place
+    per_target = [
+        MultivariateTE().analyse_single_target(
+            settings=dict(settings), data=data, target=target
+        )
+        for target in targets
+    ]
+
+    gathered = comm.gather(per_target, root=0)
+    if rank != 0:
+        return None
+
+    results_list = [result for rank_results in gathered for result in rank_results]
+    results = deepcopy(results_list[0])
+    results.combine_results(*results_list[1:])
+
+    if settings["fdr_correction"]:
+        results = network_fdr(settings, results)
+
+    return results
+
+
+def selected_edges(results, targets: list[int], fdr: bool) -> set[tuple]:
+    """Selected (source, target, lag) of the analysed targets."""
+    edges = set()
+    for target in targets:
+        try:
+            single = results.get_single_target(target, fdr=fdr)
+        except RuntimeError:
+            # No significant sources left after the FDR correction
+            continue
+        selected = single["selected_vars_sources"]
+        edges.update((source, target, lag) for source, lag in selected)
+    return edges
+
+
+def drill_down(
+    df: pd.DataFrame,
+    groups: pd.DataFrame,
+    group_columns: list[str],
+    results,
+    settings=None,
+) -> dict:
+    """
+    Constituent-level analyses inside the groups with significant edges.
+
+    Args:
+        df: Constituent-level panel from prepare_data()
+        groups: Groups of the constituents from load_groups()
+        group_columns: Columns of the group-level panel, in process order
+        results: Network results of the group-level panel
+        settings: Settings of the constituent-level analyses
+
+    Returns:
+        Network results per drilled down group
+    """
+    settings = SETTINGS if settings is None else settings
+    edges = selected_edges(
+        results, results.targets_analysed, fdr=settings["fdr_correction"]
+    )
+    # Groups of the sources and targets of the edges
+    processes = {process for source, target, _ in edges for process in (source, target)}
+    involved = sorted({group_columns[p].split("_", 1)[0] for p in processes})
+    print(f"Groups with significant edges: {involved}")
+
+    drilled = {}
+    for group in involved:
+        tickers = set(groups.index[groups["group"] == group])
+        columns = [c for c in df.columns if c.split("_", 1)[0] in tickers]
+        print(f"Drilling down into {group}: {len(columns)} processes")
+        drilled[group] = run_analysis(df[columns], settings)
+    return drilled
+
+
+def report_results(results):
+    import matplotlib.pyplot as plt
+    from idtxl.visualise_graph import plot_network
 
     # Plot inferred network to console and via matplotlib
     print("FDR uncorrected edge list:")
@@ -130,3 +328,107 @@ if __name__ == "__main__":
     print("FDR corrected source variables:")
     source_vars_fdr = results.get_source_variables(fdr=True)
     print(source_vars_fdr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multivariate TE analysis")
+    parser.add_argument("--aggregate-dir", default=os.path.join("data", "aggregate"))
+    parser.add_argument(
+        "--frequency",
+        help="Bar frequency to load from a multi-frequency panel in --aggregate-dir",
+    )
+    parser.add_argument(
+        "--features",
+        nargs="+",
+        default=["SENTIMENT"],
+        help="Sentiment features from the aggregate to analyse next to the returns",
+    )
+    parser.add_argument(
+        "--mpi",
+        choices=["targets", "estimator"],
+        help="Distribute targets across the ranks of mpirun, or the estimations "
+        "within a target across the workers of mpi4py.futures",
+    )
+    parser.add_argument(
+        "--max-workers", type=int, default=4, help="MPI workers in estimator mode"
+    )
+    parser.add_argument(
+        "--level",
+        choices=["constituent", *GROUP_COLUMNS],
+        default="constituent",
+        help="Analyse sectors or countries (cap-weighted returns, summed sentiment) "
+        "instead of the constituents",
+    )
+    parser.add_argument(
+        "--drill-down",
+        action="store_true",
+        help="Rerun constituent-level TE inside the groups with significant edges",
+    )
+    parser.add_argument(
+        "--constituents", default=os.path.join("data", "constituents.csv")
+    )
+    parser.add_argument(
+        "--symbolic",
+        action="store_true",
+        help="Screen all pairs with symbolic TE on ordinal patterns instead of IDTxl",
+    )
+    parser.add_argument(
+        "--order", type=int, default=2, help="Values per ordinal pattern (--symbolic)"
+    )
+    parser.add_argument(
+        "--delay", type=int, default=1, help="Samples between pattern values"
+    )
+    args = parser.parse_args()
+    if args.drill_down and args.level == "constituent":
+        parser.error("--drill-down needs --level sector or country")
+    if args.drill_down and args.mpi == "targets":
+        parser.error("--drill-down is not supported with --mpi targets")
+    if args.symbolic and (args.drill_down or args.mpi):
+        parser.error("--symbolic runs without --drill-down and --mpi")
+
+    df = prepare_data(
+        args.aggregate_dir, frequency=args.frequency, features=args.features
+    )
+    panel = df
+    if args.level != "constituent":
+        groups = load_groups(args.level, args.constituents)
+        panel = group_panel(df, groups)
+
+    # Print the column names with their indices
+    print("Columns in the DataFrame:")
+    print([f"{i}: {col}" for i, col in enumerate(panel.columns)])
+
+    # exit()
+
+    if args.symbolic:
+        # symbolic_te imports this module
+        from symbolic_te import screen_network
+
+        edges = screen_network(
+            panel,
+            args.order,
+            args.delay,
+            SETTINGS["max_lag_sources"],
+            alpha=SETTINGS["alpha_fdr"],
+        )
+        print("Symbolic TE edges (FDR corrected):")
+        print(edges[edges["significant"]].to_string(index=False))
+    else:
+        settings = SETTINGS
+        if args.mpi == "estimator":
+            settings = {**SETTINGS, "MPI": True, "max_workers": args.max_workers}
+
+        if args.mpi == "targets":
+            results = run_analysis_mpi(panel)
+        else:
+            results = run_analysis(panel, settings)
+
+        # Only rank 0 holds the combined results in the targets mode
+        if results is not None:
+            report_results(results)
+
+        if args.drill_down:
+            drilled = drill_down(df, groups, list(panel.columns), results, settings)
+            for group, group_results in drilled.items():
+                print(f"{group} FDR corrected edge list:")
+                group_results.print_edge_list(weights="max_te_lag", fdr=True)